@@ -0,0 +1,66 @@
+from script import WITNESS_SCALE_FACTOR
+
+
+MAX_BLOCK_WEIGHT = 4000000
+MAX_BLOCK_SIGOPS_COST = 80000
+# The 80-byte header and the largest transaction count VarInt we expect
+# (3 bytes covers up to 65535 transactions) count towards the block weight
+BLOCK_HEADER_WEIGHT = 80 * WITNESS_SCALE_FACTOR
+TX_COUNT_WEIGHT = 3 * WITNESS_SCALE_FACTOR
+
+SATOSHIS_PER_BITCOIN = 100000000
+# The subsidy started at 50 BTC and halves every 210,000 blocks
+INITIAL_BLOCK_SUBSIDY = 50 * SATOSHIS_PER_BITCOIN
+HALVING_INTERVAL = 210000
+
+
+# Block subsidy in satoshis at the given height. The schedule can be changed
+# through the initial subsidy and the halving interval, e.g. for test chains.
+def get_block_subsidy(
+        block_height,
+        initial_subsidy=INITIAL_BLOCK_SUBSIDY,
+        halving_interval=HALVING_INTERVAL):
+    halvings = block_height // halving_interval
+    # The subsidy is zero once it has been shifted below one satoshi
+    if halvings >= 64:
+        return 0
+    return initial_subsidy >> halvings
+
+
+class BlockAccounting:
+    """Running integer totals for the transactions selected into a block.
+
+    Weight and sigops start with the space reserved for the header, the
+    transaction count and the coinbase, so the totals always describe the
+    whole block and the coinbase value is known as soon as selection ends.
+    """
+
+    def __init__(
+            self,
+            block_subsidy,
+            coinbase_weight,
+            coinbase_sigops,
+            max_block_weight=MAX_BLOCK_WEIGHT,
+            max_block_sigops=MAX_BLOCK_SIGOPS_COST):
+        self.block_subsidy = block_subsidy
+        self.max_block_weight = max_block_weight
+        self.max_block_sigops = max_block_sigops
+        self.fees = 0
+        self.weight = BLOCK_HEADER_WEIGHT + TX_COUNT_WEIGHT + coinbase_weight
+        self.sigops = coinbase_sigops
+        self.tx_count = 0
+
+    def fits(self, tx):
+        return (self.weight + tx.weight <= self.max_block_weight
+                and self.sigops + tx.sigops <= self.max_block_sigops)
+
+    def add(self, tx):
+        self.fees += tx.fee
+        self.weight += tx.weight
+        self.sigops += tx.sigops
+        self.tx_count += 1
+
+    @property
+    def coinbase_value(self):
+        # The most the coinbase may claim: subsidy plus every selected fee
+        return self.block_subsidy + self.fees
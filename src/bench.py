@@ -0,0 +1,53 @@
+import os
+import time
+import tracemalloc
+
+from load_transactions import load_transaction_file, decode_transaction_file
+
+
+# Time a decoder over every JSON file in the mempool and measure the memory
+# retained by the decoded transactions.
+def bench_decoder(decoder, mempool_path='mempool/'):
+    paths = [os.path.join(mempool_path, filename)
+             for filename in sorted(os.listdir(mempool_path))
+             if filename.endswith('.json')]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    decoded = [decoder(path) for path in paths]
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Repeat the run without tracing for a timing free of tracemalloc
+    # overhead.
+    start = time.perf_counter()
+    for path in paths:
+        decoder(path)
+    untraced = time.perf_counter() - start
+
+    del decoded
+    return {
+        'files': len(paths),
+        'seconds': untraced,
+        'traced_seconds': elapsed,
+        'retained_bytes': retained,
+        'peak_bytes': peak,
+    }
+
+
+def bench_decoders(mempool_path='mempool/'):
+    results = {}
+    for name, decoder in (('json.load', load_transaction_file),
+                          ('decode_transaction_file', decode_transaction_file)):
+        results[name] = bench_decoder(decoder, mempool_path)
+    return results
+
+
+def print_results(results):
+    for name, result in results.items():
+        print(f"{name:<26} {result['files']} files  "
+              f"{result['seconds']:.3f}s  "
+              f"retained {result['retained_bytes'] / 2**20:.1f} MiB  "
+              f"peak {result['peak_bytes'] / 2**20:.1f} MiB")
+
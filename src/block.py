@@ -1,9 +1,13 @@
 import time
 import struct
 
+from accounting import (BlockAccounting, get_block_subsidy, MAX_BLOCK_WEIGHT,
+                        MAX_BLOCK_SIGOPS_COST, INITIAL_BLOCK_SUBSIDY,
+                        HALVING_INTERVAL)
 from coinbase import create_coinbase_transaction
-from hashing import hash256, calculate_merkle_root
-from serialize import serialize_coinbase_tx
+from hashing import hash256, hash256_bytes, calculate_merkle_root
+from serialize import serialize_coinbase_tx, to_bytes
+from output import format_output_lines
 
 
 def difficulty_target_to_bits(difficulty_target):
@@ -39,15 +43,19 @@ def difficulty_target_to_bits(difficulty_target):
     return bits
 
 
-def mine_block(
-        valid_transactions,
-        bitcoin_address,
-        previous_block_hash,
-        difficulty_target,
-        block_height,
-        block_subsidy,
-        max_block_weight=4000000,
-        estimated_coinbase_weight=544):  # Max block weight defined by SegWit
+# Weight and sigop cost of the coinbase, measured on a placeholder with no
+# fees. Output values and the witness commitment have fixed sizes, so the
+# real coinbase is exactly as large.
+def measure_coinbase(bitcoin_address, block_height):
+    coinbase_tx = create_coinbase_transaction(
+        bitcoin_address, 0, block_height, [])
+    total_size = len(serialize_coinbase_tx(coinbase_tx, block_height)) // 2
+    base_size = len(serialize_coinbase_tx(
+        coinbase_tx, block_height, include_witness=False)) // 2
+    return base_size * 3 + total_size, coinbase_tx.sigops
+
+
+def select_transactions(valid_transactions, accounting):
     # Calculate fee per weight unit for each transaction and add it as an
     # attribute.
     for tx in valid_transactions:
@@ -56,71 +64,176 @@ def mine_block(
     # Sort transactions by fee per weight unit in descending order.
     valid_transactions.sort(key=lambda x: x.fee_per_weight, reverse=True)
 
+    # A transaction spending an output of another pool transaction can only
+    # follow its parent into the block.
+    pool_txids = {tx.txid for tx in valid_transactions}
+    parents = {tx.txid: {to_bytes(vin['txid']).hex() for vin in tx.vin}
+               & pool_txids for tx in valid_transactions}
+
     # Initialize the list of transactions to include in the block.
     included_transactions = []
+    included_txids = set()
+    # Children waiting for a parent to be included, keyed by that parent
+    waiting = {}
+
+    def missing_parent(tx):
+        for parent_txid in parents[tx.txid]:
+            if parent_txid not in included_txids:
+                return parent_txid
+        return None
+
+    # Iterate over valid transactions in a single pass, keeping running
+    # totals so the coinbase value is known once selection ends. Including
+    # a transaction releases any children that were waiting for it.
+    for candidate in valid_transactions:
+        pending = [candidate]
+        while pending:
+            tx = pending.pop()
+            parent_txid = missing_parent(tx)
+            if parent_txid is not None:
+                waiting.setdefault(parent_txid, []).append(tx)
+                continue
+            if not accounting.fits(tx):
+                continue
+            accounting.add(tx)
+            included_transactions.append(tx)
+            included_txids.add(tx.txid)
+            pending.extend(reversed(waiting.pop(tx.txid, [])))
 
-    # Placeholder for calculating total weight of included transactions
-    current_block_weight = 0
+    return included_transactions
 
-    # Iterate over valid transactions to select those that fit within the
-    # block weight limit.
-    for tx in valid_transactions:
-        if current_block_weight + tx.weight <= max_block_weight - estimated_coinbase_weight:
-            included_transactions.append(tx)
-            current_block_weight += tx.weight
 
-    # Create the coinbase transaction as a Transaction instance
+# Assemble everything in a block except the nonce. The block is returned as
+# a dict that mine_header completes and the writers in output.py consume.
+# block_subsidy is in satoshis; None follows the halving schedule given by
+# initial_subsidy and halving_interval.
+def build_block_template(
+        valid_transactions,
+        bitcoin_address,
+        previous_block_hash,
+        difficulty_target,
+        block_height,
+        block_subsidy=None,
+        max_block_weight=MAX_BLOCK_WEIGHT,
+        max_block_sigops=MAX_BLOCK_SIGOPS_COST,
+        initial_subsidy=INITIAL_BLOCK_SUBSIDY,
+        halving_interval=HALVING_INTERVAL):
+    if block_subsidy is None:
+        block_subsidy = get_block_subsidy(
+            block_height, initial_subsidy, halving_interval)
+    coinbase_weight, coinbase_sigops = measure_coinbase(
+        bitcoin_address, block_height)
+    accounting = BlockAccounting(
+        block_subsidy,
+        coinbase_weight,
+        coinbase_sigops,
+        max_block_weight,
+        max_block_sigops)
+    included_transactions = select_transactions(
+        valid_transactions, accounting)
+
+    # Create the coinbase transaction as a Transaction instance, claiming
+    # the subsidy and every fee collected during selection
     coinbase_tx = create_coinbase_transaction(
-        bitcoin_address, block_subsidy, block_height, included_transactions)
+        bitcoin_address,
+        accounting.block_subsidy,
+        block_height,
+        included_transactions,
+        accounting.fees)
+    print("Witness commitment in coinbase tx:",
+          coinbase_tx.vout[1]["scriptpubkey"])
     coinbase_serialized = serialize_coinbase_tx(coinbase_tx, block_height)
 
-    # Compute the coinbase transaction hash and assign it as its txid
-    coinbase_hash = hash256(coinbase_serialized)
-    coinbase_tx.txid = coinbase_hash
-
-    # Prepend the coinbase transaction to the list of included transactions
-    included_transactions.insert(0, coinbase_tx)
+    # The txid is the hash of the serialization without witness data, in
+    # display (byte-reversed) order like every other txid
+    coinbase_hash = hash256(serialize_coinbase_tx(
+        coinbase_tx, block_height, include_witness=False))
+    coinbase_tx.txid = bytes.fromhex(coinbase_hash)[::-1].hex()
 
     # Generate txids list including the actual TXID of the updated coinbase_tx
-    txids = [tx.txid for tx in included_transactions]
-
-    # Calculate the Merkle root of the txids list
-    merkle_root = calculate_merkle_root(txids)
-    version = 4  # Block Version 4 became active in December 2015
-    timestamp = int(time.time())
-    nonce = 0
-    bits = difficulty_target_to_bits(difficulty_target)
-
+    txids = [coinbase_tx.txid] + [tx.txid for tx in included_transactions]
+
+    return {
+        "version": 4,  # Block Version 4 became active in December 2015
+        "previous_block_hash": previous_block_hash,
+        # Calculate the Merkle root of the txids list
+        "merkle_root": calculate_merkle_root(txids),
+        "timestamp": int(time.time()),
+        "bits": difficulty_target_to_bits(difficulty_target),
+        "difficulty_target": difficulty_target,
+        "height": block_height,
+        "block_subsidy": accounting.block_subsidy,
+        "fees": accounting.fees,
+        "coinbase_value": accounting.coinbase_value,
+        "weight": accounting.weight,
+        "sigops": accounting.sigops,
+        "max_block_weight": max_block_weight,
+        "max_block_sigops": max_block_sigops,
+        "coinbase_tx": coinbase_tx,
+        "coinbase_serialized": coinbase_serialized,
+        "transactions": included_transactions,
+        "nonce": 0,
+        "header": None,
+    }
+
+
+def mine_header(block):
     # Convert hex strings to binary for header components
-    prev_block_hash_bin = bytes.fromhex(previous_block_hash)
-    merkle_root_bin = bytes.fromhex(merkle_root)
+    prev_block_hash_bin = bytes.fromhex(block["previous_block_hash"])
+    merkle_root_bin = bytes.fromhex(block["merkle_root"])
+    target = int(block["difficulty_target"], 16)
+    nonce = block["nonce"]
+
+    # Everything but the nonce is fixed, so pack it once
+    header_prefix = struct.pack(
+        "<L32s32sLL",
+        block["version"],
+        prev_block_hash_bin,
+        merkle_root_bin,
+        block["timestamp"],
+        block["bits"])
 
     # Mining process: find a nonce that satisfies the difficulty target
     while True:
-        header = struct.pack(
-            "<L32s32sLLL",
-            version,
-            prev_block_hash_bin,
-            merkle_root_bin,
-            timestamp,
-            bits,
-            nonce)
-
-        header_hash = hash256(header.hex())
-        reversed_hash = header_hash[::-1]
-
-        if int(reversed_hash, 16) < int(difficulty_target, 16):
-            print(f"Block mined! Nonce: {nonce}, Hash: {reversed_hash}")
+        header = header_prefix + struct.pack("<L", nonce)
+
+        # The header hash is compared to the target as a little-endian
+        # number
+        header_hash = hash256_bytes(header)
+
+        if int.from_bytes(header_hash, 'little') < target:
+            print(
+                f"Block mined! Nonce: {nonce}, Hash: {header_hash[::-1].hex()}")
             break
         nonce += 1
 
-    # Prepare the output
-    output_lines = [header.hex()]
-    # Add serialized coinbase transaction on line 2
-    output_lines.append(coinbase_serialized)
+    block["nonce"] = nonce
+    block["header"] = header
+    return header
+
 
-    # Append the txid of the coinbase transaction and other transactions
-    for tx in included_transactions:
-        output_lines.append(tx.txid)
+def mine_block(
+        valid_transactions,
+        bitcoin_address,
+        previous_block_hash,
+        difficulty_target,
+        block_height,
+        block_subsidy=None,
+        max_block_weight=MAX_BLOCK_WEIGHT,
+        max_block_sigops=MAX_BLOCK_SIGOPS_COST,
+        initial_subsidy=INITIAL_BLOCK_SUBSIDY,
+        halving_interval=HALVING_INTERVAL):
+    block = build_block_template(
+        valid_transactions,
+        bitcoin_address,
+        previous_block_hash,
+        difficulty_target,
+        block_height,
+        block_subsidy,
+        max_block_weight,
+        max_block_sigops,
+        initial_subsidy,
+        halving_interval)
+    mine_header(block)
 
-    return output_lines
+    return format_output_lines(block)
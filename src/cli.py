@@ -0,0 +1,272 @@
+import argparse
+import os
+import sys
+
+from accounting import INITIAL_BLOCK_SUBSIDY, HALVING_INTERVAL
+from output import OUTPUT_FORMATS
+
+
+# Defaults for the challenge block; every one can be overridden by a flag
+DEFAULT_MEMPOOL_PATH = 'mempool/'
+DEFAULT_PREVIOUS_BLOCK_HASH = 'ffffffffffffffffffffffffffffffffffffffffffffffffffff00000000'
+DEFAULT_DIFFICULTY_TARGET = '0000ffff00000000000000000000000000000000000000000000000000000000'
+DEFAULT_BITCOIN_ADDRESS = "1LuckyR1fFHEsXYyx5QK4UFzv3PEAepPMK"
+DEFAULT_BLOCK_HEIGHT = 834637
+DEFAULT_OUTPUT_PATH = 'output.txt'
+DEFAULT_TEMPLATE_PATH = 'template.json'
+
+# Modules that importing the CLI must not pull in; each subcommand imports
+# what it needs when it runs
+LAZY_MODULES = ('base58', 'bech32', 'orjson', 'concurrent.futures',
+                'transaction', 'block', 'coinbase', 'load_transactions',
+                'validate_block', 'server')
+# Budget for `import cli`, checked by `bench startup`
+MAX_STARTUP_IMPORT_MS = 50
+
+
+def cmd_ingest(args):
+    from load_transactions import load_transactions
+
+    transactions = load_transactions(args.mempool, args.max_pool_weight)
+    total_fees = sum(tx.fee for tx in transactions)
+    total_weight = sum(tx.weight for tx in transactions)
+    print(f"{len(transactions)} valid transactions, "
+          f"{total_fees} sat in fees, {total_weight} weight units")
+    return 0
+
+
+def _build_block(args):
+    from block import build_block_template
+    from load_transactions import load_transactions
+
+    return build_block_template(
+        load_transactions(args.mempool, args.max_pool_weight),
+        args.address,
+        args.previous_block_hash,
+        args.difficulty_target,
+        args.block_height,
+        args.block_subsidy,
+        initial_subsidy=args.initial_subsidy,
+        halving_interval=args.halving_interval)
+
+
+def cmd_template(args):
+    from output import write_getblocktemplate
+
+    write_getblocktemplate(_build_block(args), args.output)
+    return 0
+
+
+def cmd_mine(args):
+    from block import mine_header
+    from output import write_block_output
+
+    block = _build_block(args)
+    mine_header(block)
+    write_block_output(block, args.output, args.format)
+    return 0
+
+
+def cmd_validate(args):
+    import logging
+    from validate_block import BlockValidator
+
+    validator = BlockValidator(
+        args.mempool,
+        workers=args.workers,
+        initial_subsidy=args.initial_subsidy,
+        halving_interval=args.halving_interval)
+    try:
+        if args.format == 'lines':
+            errors = validator.validate_output_file(
+                args.path, args.block_height, args.block_subsidy)
+        else:
+            mode = 'rb' if args.format == 'block' else 'r'
+            with open(args.path, mode) as file:
+                raw_block = file.read()
+            if args.format == 'block-hex':
+                raw_block = bytes.fromhex(raw_block.strip())
+            errors = validator.validate_raw_block(
+                raw_block, args.block_height, args.block_subsidy)
+    finally:
+        validator.close()
+
+    if errors:
+        logging.error(f"Block is invalid: {', '.join(errors)}")
+        return 1
+    logging.info("Block is valid.")
+    return 0
+
+
+def cmd_serve(args):
+    import logging
+    from server import create_template_server, make_rpc_server
+
+    template_server = create_template_server(
+        args.mempool,
+        args.address,
+        args.previous_block_hash,
+        args.difficulty_target,
+        args.block_height,
+        args.block_subsidy,
+        args.max_pool_weight,
+        args.initial_subsidy,
+        args.halving_interval)
+    server = make_rpc_server(template_server, args.host, args.port)
+    logging.info("Serving JSON-RPC on http://%s:%d/" % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+# Import `cli` in a fresh interpreter with -X importtime and return the
+# cumulative import time in milliseconds and the modules it imported.
+def measure_startup():
+    import subprocess
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import cli'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True)
+
+    # Lines look like "import time: self | cumulative | <indent>name". A
+    # module's own imports are listed, indented, right before it.
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        indent = len(name) - len(name.lstrip())
+        rows.append((int(cumulative), indent, name.strip()))
+
+    cumulative, cli_indent, _ = next(row for row in rows if row[2] == 'cli')
+    position = rows.index((cumulative, cli_indent, 'cli'))
+    imported = []
+    for _, indent, name in reversed(rows[:position]):
+        if indent <= cli_indent:
+            break
+        imported.append(name)
+    return cumulative / 1000, imported
+
+
+def cmd_bench(args):
+    if args.target == 'decode':
+        from bench import bench_decoders, print_results
+
+        print_results(bench_decoders(args.mempool))
+        return 0
+
+    # Startup regression check: importing the CLI must stay cheap and must
+    # not load any subcommand's dependencies
+    startup_ms, imported = measure_startup()
+    eager = [name for name in imported
+             if name in LAZY_MODULES or name.startswith('concurrent.')]
+    print(f"import cli: {startup_ms:.1f} ms, {len(imported)} modules")
+    if eager:
+        print(f"Imported eagerly: {', '.join(sorted(set(eager)))}")
+    if startup_ms > args.max_import_ms:
+        print(f"Startup exceeds the {args.max_import_ms} ms budget")
+    return 1 if eager or startup_ms > args.max_import_ms else 0
+
+
+# The halving schedule followed when --block-subsidy is not given
+def add_subsidy_schedule_arguments(parser):
+    parser.add_argument('--initial-subsidy', type=int,
+                        default=INITIAL_BLOCK_SUBSIDY,
+                        help="subsidy in satoshis at height 0")
+    parser.add_argument('--halving-interval', type=int,
+                        default=HALVING_INTERVAL,
+                        help="blocks between subsidy halvings")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='miner',
+        description="Validate mempool transactions and build, mine and "
+                    "check blocks.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # Options shared by every subcommand that builds a block
+    chain = argparse.ArgumentParser(add_help=False)
+    chain.add_argument('--mempool', default=DEFAULT_MEMPOOL_PATH,
+                       help="directory of transaction JSON files")
+    chain.add_argument('--block-height', type=int,
+                       default=DEFAULT_BLOCK_HEIGHT)
+    chain.add_argument('--block-subsidy', type=int, default=None,
+                       help="subsidy in satoshis (default: halving schedule)")
+    add_subsidy_schedule_arguments(chain)
+    chain.add_argument('--max-pool-weight', type=int, default=None,
+                       help="cap the mempool at this many weight units, "
+                            "evicting the lowest fee-rate packages")
+
+    template = argparse.ArgumentParser(add_help=False)
+    template.add_argument('--address', default=DEFAULT_BITCOIN_ADDRESS,
+                          help="P2PKH address paid by the coinbase")
+    template.add_argument('--previous-block-hash',
+                          default=DEFAULT_PREVIOUS_BLOCK_HASH)
+    template.add_argument('--difficulty-target',
+                          default=DEFAULT_DIFFICULTY_TARGET)
+
+    ingest = subparsers.add_parser(
+        'ingest', help="load and validate the mempool")
+    ingest.add_argument('--mempool', default=DEFAULT_MEMPOOL_PATH)
+    ingest.add_argument('--max-pool-weight', type=int, default=None,
+                        help="cap the mempool at this many weight units")
+    ingest.set_defaults(handler=cmd_ingest)
+
+    template_cmd = subparsers.add_parser(
+        'template', parents=[chain, template],
+        help="write a getblocktemplate JSON without mining")
+    template_cmd.add_argument('--output', default=DEFAULT_TEMPLATE_PATH)
+    template_cmd.set_defaults(handler=cmd_template)
+
+    mine = subparsers.add_parser(
+        'mine', parents=[chain, template], help="build and mine a block")
+    mine.add_argument('--output', default=DEFAULT_OUTPUT_PATH)
+    mine.add_argument('--format', choices=OUTPUT_FORMATS, default='lines')
+    mine.set_defaults(handler=cmd_mine)
+
+    validate = subparsers.add_parser(
+        'validate', help="independently check a block")
+    validate.add_argument('path', nargs='?', default=DEFAULT_OUTPUT_PATH)
+    validate.add_argument('--mempool', default=DEFAULT_MEMPOOL_PATH,
+                          help="directory the prevouts are read from")
+    validate.add_argument('--block-height', type=int, default=None,
+                          help="expected height (default: from the coinbase)")
+    validate.add_argument('--block-subsidy', type=int, default=None,
+                          help="subsidy in satoshis (default: halving schedule)")
+    add_subsidy_schedule_arguments(validate)
+    validate.add_argument('--format', choices=('lines', 'block', 'block-hex'),
+                          default='lines')
+    validate.add_argument('--workers', type=int, default=None,
+                          help="processes for per-transaction checks")
+    validate.set_defaults(handler=cmd_validate)
+
+    serve = subparsers.add_parser(
+        'serve', parents=[chain, template],
+        help="run the local JSON-RPC template server")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8332)
+    serve.set_defaults(handler=cmd_serve)
+
+    bench = subparsers.add_parser('bench', help="run benchmarks")
+    bench.add_argument('target', choices=('decode', 'startup'))
+    bench.add_argument('--mempool', default=DEFAULT_MEMPOOL_PATH)
+    bench.add_argument('--max-import-ms', type=float,
+                       default=MAX_STARTUP_IMPORT_MS)
+    bench.set_defaults(handler=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
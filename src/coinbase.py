@@ -1,14 +1,16 @@
-import base58
 import hashlib
 
 from transaction import Transaction
-from hashing import hash256, calculate_merkle_root
+from hashing import hash256_batch, hash256_bytes, merkle_root_from_hashes
 from serialize import serialize_block_height
 
 
 # WARNING CAN I USE THE DECODER??
 # Converts a Bitcoin address to a scriptPubKey.
 def bitcoin_address_to_script_pub_key(bitcoin_address):
+    # base58 is only needed here, so it is not imported with the module
+    import base58
+
     # Decode the address using Base58Check to get the payload
     decoded = base58.b58decode_check(bitcoin_address)
     # For P2PKH, prefix with OP_DUP, OP_HASH160, push operation, and postfix
@@ -18,47 +20,34 @@ def bitcoin_address_to_script_pub_key(bitcoin_address):
     return script_pub_key.hex()
 
 
-def reverse_hex_string(hex_str):
-    # Convert hex string to bytes
-    byte_seq = bytes.fromhex(hex_str)
-
-    # Reverse the byte sequence
-    reversed_byte_seq = byte_seq[::-1]
-
-    # Convert back to hex string
-    reversed_hex_str = reversed_byte_seq.hex()
-
-    return reversed_hex_str
-
-
 def calculate_witness_commitment(transactions, witness_reserved_value):
-    # Reverse the hex string of the double SHA-256 hash of each transaction's
-    # Witness Transaction ID (wtxid)
-    all_tx_wtxids = [
-        reverse_hex_string(
-            hash256(
-                tx.get_wtxid())) for tx in transactions]
+    # Hash every transaction's witness serialization in one batch. The
+    # digests come back packed in internal byte order, which is the order
+    # the Merkle tree is built in.
+    all_tx_wtxids = hash256_batch(
+        [tx.serialize_bytes(include_witness=True) for tx in transactions])
 
     # Insert the witness reserved value at the beginning of the list of all transaction wtxids.
     # This is presumably to include a specific reserved value in the calculation of the Merkle root,
     # which is a requirement for witness commitments in SegWit.
-    all_tx_wtxids.insert(0, witness_reserved_value)
+    witness_reserved_bytes = bytes.fromhex(witness_reserved_value)
+    all_tx_wtxids = witness_reserved_bytes + all_tx_wtxids
 
     # Calculate the Merkle root of all transaction wtxids
-    merkle_root_of_wtxids = calculate_merkle_root(all_tx_wtxids)
+    merkle_root_of_wtxids = merkle_root_from_hashes(all_tx_wtxids)
 
     # Concatenate the calculated Merkle root with the witness reserved value
-    # to form a combined string.
-    combined = merkle_root_of_wtxids + witness_reserved_value
-
-    # Calculate the double SHA-256 hash of the combined Merkle root and witness reserved value.
+    # and take the double SHA-256 hash of the result.
     # This final hash is the witness commitment, which is included in a SegWit
     # coinbase transaction.
-    witness_commitment = hash256(combined)
+    witness_commitment = hash256_bytes(
+        merkle_root_of_wtxids + witness_reserved_bytes)
 
-    return witness_commitment
+    return witness_commitment.hex()
 
 
+# block_subsidy and tx_fees are integer satoshis, so the coinbase value is
+# exact.
 def create_coinbase_transaction(
     bitcoin_address,
     block_subsidy,
@@ -66,9 +55,7 @@ def create_coinbase_transaction(
     valid_transactions,
     tx_fees=0,
 ):
-    # Convert block subsidy from bitcoins to satoshis
-    block_subsidy_sats = int(block_subsidy * 100000000)
-    total_value = block_subsidy_sats + tx_fees
+    total_value = block_subsidy + tx_fees
 
     script_pub_key = bitcoin_address_to_script_pub_key(bitcoin_address)
 
@@ -109,5 +96,4 @@ def create_coinbase_transaction(
         "witness": [[witness_reserved_value]]
     }
 
-    print("Witness commitment in coinbase tx:", witness_commitment_script)
     return Transaction(coinbase_tx_data, is_coinbase=True)
@@ -1,11 +1,96 @@
 import hashlib
+import os
+
+
+# hashlib releases the GIL while hashing inputs larger than 2047 bytes, so
+# only batches of large messages benefit from extra threads.
+GIL_RELEASE_MIN_SIZE = 2048
+# Below this many bytes in total the thread start-up cost outweighs any
+# parallel speed-up.
+PARALLEL_MIN_BYTES = 1 << 20
+
+
+def hash256_bytes(data):
+    # Double SHA-256 of raw bytes, returning the raw 32-byte digest
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
 
 
 def hash256(hex_str):
     bytes_ = bytes.fromhex(hex_str)  # Convert hex string to bytes
-    hash_once = hashlib.sha256(bytes_).digest()
-    hash_twice = hashlib.sha256(hash_once).digest()
-    return hash_twice.hex()
+    return hash256_bytes(bytes_).hex()
+
+
+def _split_messages(messages, message_size):
+    # A contiguous buffer is split into fixed-size messages without copying
+    if message_size is None:
+        return list(messages)
+    if message_size <= 0:
+        raise ValueError("Message size must be positive")
+    view = memoryview(messages)
+    if len(view) % message_size:
+        raise ValueError(
+            "Buffer length is not a multiple of the message size")
+    return [view[i:i + message_size]
+            for i in range(0, len(view), message_size)]
+
+
+def _hash256_chunk(messages):
+    sha256 = hashlib.sha256
+    return b''.join(sha256(sha256(message).digest()).digest()
+                    for message in messages)
+
+
+def hash256_batch(messages, message_size=None, workers=None):
+    """Double SHA-256 many messages, returning the digests packed together.
+
+    `messages` is either a sequence of bytes-like objects, or a contiguous
+    buffer when `message_size` gives the length of each message in it. The
+    digest of message i is at result[32 * i:32 * (i + 1)].
+
+    Batches of at least 1 MiB whose messages average 2 KiB or more are
+    hashed on `workers` threads (default: CPU count); hashlib only releases
+    the GIL for inputs that large. Merkle pairs (64 bytes) and typical
+    transactions are smaller, so they are always hashed on the calling
+    thread.
+    """
+    messages = _split_messages(messages, message_size)
+    if not messages:
+        return b''
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    total_size = sum(len(message) for message in messages)
+    if (workers <= 1
+            or len(messages) < workers
+            or total_size < PARALLEL_MIN_BYTES
+            or total_size // len(messages) < GIL_RELEASE_MIN_SIZE):
+        return _hash256_chunk(messages)
+
+    # Imported here so callers that never hash in parallel skip its cost
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Give each thread one contiguous slice so results join back in order
+    chunk_size = -(-len(messages) // workers)
+    chunks = [messages[i:i + chunk_size]
+              for i in range(0, len(messages), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return b''.join(executor.map(_hash256_chunk, chunks))
+
+
+def merkle_root_from_hashes(hashes):
+    # `hashes` is a packed buffer of 32-byte hashes in internal (little-endian)
+    # byte order. Each level is hashed as one batch of 64-byte pairs.
+    level = bytes(hashes)
+    if not level:
+        return None
+
+    while len(level) > 32:
+        # Duplicate the last hash when a level has an odd number of hashes
+        if len(level) % 64:
+            level += level[-32:]
+        level = hash256_batch(level, message_size=64)
+
+    return level
 
 
 def calculate_merkle_root(transactions):
@@ -13,29 +98,8 @@ def calculate_merkle_root(transactions):
     if not transactions:
         return None
 
-    # Initial processing of transaction IDs: convert each to little-endian hex
-    tx_hashes = []
-    for tx in transactions:
-        little_endian_hex = bytes.fromhex(tx)[::-1].hex()
-        tx_hashes.append(little_endian_hex)
-
-    # Iteratively calculate the Merkle root
-    while len(tx_hashes) > 1:
-        next_level = []
-        for i in range(0, len(tx_hashes), 2):
-            # Check if this is the last element without a pair
-            if i + 1 == len(tx_hashes):
-                # Duplicate it before hashing
-                combined_hash = tx_hashes[i] + tx_hashes[i]
-            else:
-                # Otherwise, combine it with its pair
-                combined_hash = tx_hashes[i] + tx_hashes[i + 1]
-
-            # Hash the combined pair
-            pair_hash = hash256(combined_hash)
-            next_level.append(pair_hash)
-
-        # Update tx_hashes with the hashes from the current level
-        tx_hashes = next_level
-
-    return bytes.fromhex(tx_hashes[0]).hex()
+    # Initial processing of transaction IDs: convert each to little-endian
+    # bytes and pack them into one buffer
+    tx_hashes = b''.join(bytes.fromhex(tx)[::-1] for tx in transactions)
+
+    return merkle_root_from_hashes(tx_hashes).hex()
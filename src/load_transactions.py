@@ -5,6 +5,15 @@ import os
 
 from transaction import Transaction
 from hashing import hash256
+from mempool import Mempool
+
+try:
+    # orjson is an optional, much faster drop-in JSON decoder. Its
+    # JSONDecodeError subclasses json.JSONDecodeError, so error handling is
+    # the same for both decoders.
+    import orjson
+except ImportError:
+    orjson = None
 
 
 logging.basicConfig(level=logging.INFO,
@@ -17,6 +26,61 @@ def load_transaction_file(file_path):
         return json.load(file)
 
 
+def decode_transaction_file(file_path):
+    """Decode a transaction file, keeping only the fields Transaction needs."""
+    with open(file_path, 'rb') as file:
+        raw = file.read()
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    return extract_transaction_fields(data)
+
+
+# Integer fields are serialized as unsigned little-endian values of a fixed
+# width, so anything else is rejected before it reaches the serializer.
+def check_uint(value, bits, name):
+    if type(value) is not int or not 0 <= value < 1 << bits:
+        raise ValueError(f"{name} must be an unsigned {bits}-bit integer")
+    return value
+
+
+# Build a slim transaction dict from the mempool JSON. The *_asm strings,
+# per-input is_coinbase flags and address metadata on outputs are dropped,
+# and hex fields are converted to bytes once here instead of on every
+# serialization.
+def extract_transaction_fields(data):
+    vin = []
+    for txin in data.get('vin', []):
+        prevout = txin['prevout']
+        slim_txin = {
+            'txid': bytes.fromhex(txin['txid']),
+            'vout': check_uint(txin['vout'], 32, 'vout'),
+            'prevout': {
+                'scriptpubkey': bytes.fromhex(prevout['scriptpubkey']),
+                'scriptpubkey_type': prevout['scriptpubkey_type'],
+                'scriptpubkey_address': prevout.get('scriptpubkey_address'),
+                'value': check_uint(prevout['value'], 64, 'prevout value'),
+            },
+            'scriptsig': bytes.fromhex(txin.get('scriptsig', '')),
+            'sequence': check_uint(txin['sequence'], 32, 'sequence'),
+        }
+        # Only SegWit inputs carry a witness field; its presence decides
+        # whether the transaction is serialized with marker and flag.
+        if 'witness' in txin:
+            slim_txin['witness'] = [bytes.fromhex(item)
+                                    for item in txin['witness']]
+        vin.append(slim_txin)
+
+    vout = [{'scriptpubkey': bytes.fromhex(txout['scriptpubkey']),
+             'value': check_uint(txout['value'], 64, 'value')}
+            for txout in data.get('vout', [])]
+
+    return {
+        'version': check_uint(data.get('version', 1), 32, 'version'),
+        'locktime': check_uint(data.get('locktime', 0), 32, 'locktime'),
+        'vin': vin,
+        'vout': vout,
+    }
+
+
 # Validate transaction filename against its SHA-256 hashed txid.
 def validate_transaction_filename(transaction, filename):
     # txid is expected to be in little endian
@@ -34,42 +98,82 @@ def validate_transaction_filename(transaction, filename):
     return True
 
 
-def process_transaction(data, filename):
-    """Process a single transaction."""
-    transaction = Transaction(data)
-    if not transaction.is_valid():
-        return None, False
-
-    # Determine transaction ID (txid) based on whether it's a SegWit
-    # transaction
-    serialized_data = transaction.serialize(include_witness='witness' in data)
+def compute_txid(transaction):
+    # The txid is computed from the serialization without witness data
+    serialized_data = transaction.serialize(include_witness=False)
     txid = hash256(serialized_data)
 
     # Convert txid to little endian
     txid_bytes = bytes.fromhex(txid)
-    txid_little_endian = txid_bytes[::-1].hex()
-    transaction.txid = txid_little_endian
-    return transaction, validate_transaction_filename(transaction, filename)
+    return txid_bytes[::-1].hex()
+
 
+def validate_transaction(transaction, filename=None):
+    """Fully validate a transaction and set its txid.
+
+    Transactions that did not come from a mempool file (filename is None)
+    skip the filename check.
+    """
+    if not transaction.is_valid():
+        return False
 
-def load_transactions(mempool_path='mempool/'):
+    transaction.txid = compute_txid(transaction)
+    if filename is None:
+        return True
+    return validate_transaction_filename(transaction, filename)
+
+
+def process_transaction(data, filename=None):
+    """Process a single transaction."""
+    transaction = Transaction(data)
+    if not validate_transaction(transaction, filename):
+        return None, False
+    return transaction, True
+
+
+# Valid transactions are added to `mempool` when one is given, or to a new
+# Mempool capped at max_pool_weight. A bounded pool evicts the lowest
+# fee-rate packages, and transactions paying less than its fee-rate floor
+# are skipped before full validation. Otherwise every valid transaction is
+# kept.
+def load_transactions(mempool_path='mempool/', max_pool_weight=None,
+                      mempool=None):
     valid_transactions = []
     invalid_transactions = 0
+    below_fee_floor = 0
+    if mempool is None and max_pool_weight is not None:
+        mempool = Mempool(max_pool_weight)
 
     for filename in os.listdir(mempool_path):
         if filename.endswith('.json'):
             try:
-                data = load_transaction_file(
+                data = decode_transaction_file(
                     os.path.join(mempool_path, filename))
-                transaction, is_valid = process_transaction(data, filename)
-                if transaction and is_valid:
+                transaction = Transaction(data)
+                if (mempool is not None
+                        and not mempool.meets_fee_floor(transaction)):
+                    # Its spenders cannot be mined without it either
+                    mempool.reject_transaction(compute_txid(transaction))
+                    below_fee_floor += 1
+                elif not validate_transaction(transaction, filename):
+                    invalid_transactions += 1
+                elif mempool is None:
                     valid_transactions.append(transaction)
                 else:
-                    invalid_transactions += 1
+                    mempool.add_transaction(transaction)
             except json.JSONDecodeError:
                 logging.error(f"Error decoding JSON from {filename}")
                 invalid_transactions += 1
 
+    if mempool is not None:
+        valid_transactions = list(mempool.transactions.values())
+    if mempool is not None and mempool.max_weight is not None:
+        logging.info(
+            f"Mempool capped at {mempool.max_weight} WU holds "
+            f"{mempool.total_weight} WU, fee floor "
+            f"{mempool.get_min_fee_rate():.3f} sat/WU, "
+            f"{below_fee_floor} tx below the floor skipped.")
+
     logging.info(
         f"Found \033[0m\033[91m{invalid_transactions}\033[0m invalid tx.")
     logging.info(
@@ -1,26 +1,8 @@
-from block import mine_block
-from load_transactions import load_transactions
+import sys
 
-if __name__ == "__main__":
-    mempool_path = 'mempool/'
-    valid_transactions = load_transactions(mempool_path)
-
-    previous_block_hash = 'ffffffffffffffffffffffffffffffffffffffffffffffffffff00000000'
-    difficulty_target = '0000ffff00000000000000000000000000000000000000000000000000000000'
-    bitcoin_address = "1LuckyR1fFHEsXYyx5QK4UFzv3PEAepPMK"
-    block_height = 834637
-    block_subsidy = 6.25
+from cli import main
 
-    # Start mining with adjusted difficulty target
-    output_lines = mine_block(
-        valid_transactions,
-        bitcoin_address,
-        previous_block_hash,
-        difficulty_target,
-        block_height,
-        block_subsidy)
-
-    # Write the output to the file
-    with open("output.txt", "w") as outfile:
-        for line in output_lines:
-            outfile.write(line + "\n")
+if __name__ == "__main__":
+    # Without arguments, mine the challenge block into output.txt as the
+    # grader expects; any arguments are passed to the CLI
+    sys.exit(main(sys.argv[1:] or ["mine"]))
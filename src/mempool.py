@@ -1,14 +1,112 @@
+import heapq
+import time
+
+from serialize import to_bytes
+
+
+# Fee rates are in satoshis per weight unit, like Transaction.fee_per_weight.
+# Raising the floor adds 1 sat/vbyte on top of the evicted package's rate.
+INCREMENTAL_FEE_RATE = 0.25
+# The fee-rate floor halves every 12 hours once nothing is being evicted
+FEE_FLOOR_HALFLIFE = 12 * 60 * 60
+# Bitcoin Core's default package limits: at most 25 in-pool ancestors and
+# 25 in-pool descendants, each count including the transaction itself
+MAX_ANCESTOR_COUNT = 25
+MAX_DESCENDANT_COUNT = 25
+# How many rejected or evicted txids are remembered, so spenders of them
+# that arrive later can be turned away (the size of Core's recent rejects)
+RECENT_REJECTS_SIZE = 120000
+
+
 class Mempool:
-    def __init__(self):
+    """Validated transactions, optionally capped by total weight.
+
+    With max_weight set, adding a transaction that overflows the cap evicts
+    the package (a transaction plus its in-pool descendants) with the
+    lowest descendant fee rate until the pool fits again. Each eviction
+    raises a rolling minimum fee rate, which decays over time; transactions
+    below it can be turned away before full validation.
+
+    Transactions may arrive before the parents they spend; a parent adopts
+    its in-pool spenders when it is added. Once a transaction is rejected
+    or evicted, its spenders can never be mined, so those in the pool leave
+    with it and later ones are rejected. With max_weight set, transactions
+    that would break the ancestor or descendant count limits are rejected.
+    The limits bound every package walk, so adding or evicting a
+    transaction costs a constant number of O(log n) heap operations. An
+    uncapped pool accepts packages of any size, like the plain list
+    load_transactions returns without a cap.
+    """
+
+    def __init__(self, max_weight=None, clock=time.monotonic,
+                 max_ancestors=MAX_ANCESTOR_COUNT,
+                 max_descendants=MAX_DESCENDANT_COUNT):
         self.seen_inputs = set()
+        # Accepted transactions by txid, in arrival order
+        self.transactions = {}
+        self.max_weight = max_weight
+        self.total_weight = 0
+        self.max_ancestors = max_ancestors
+        self.max_descendants = max_descendants
+        # In-pool parent and child txids of every transaction
+        self.parents = {}
+        self.children = {}
+        # In-pool spenders by the txid whose outputs they spend, whether or
+        # not that transaction is in the pool yet
+        self.spenders = {}
+        # Recently rejected or evicted txids, oldest first
+        self.recent_rejects = {}
+        # [fee, weight] of each transaction together with its descendants
+        self.descendant_stats = {}
+        # (descendant fee rate, sequence, txid); entries whose rate no
+        # longer matches descendant_stats are stale and skipped
+        self._eviction_heap = []
+        self._sequence = 0
+        self._clock = clock
+        self._rolling_min_fee_rate = 0.0
+        self._last_floor_update = clock()
 
     def add_transaction(self, transaction):
+        if transaction.txid in self.transactions:
+            return False
         if self.is_double_spending(transaction):
             print("Double spending detected")
+            if transaction.txid is not None:
+                self.reject_transaction(transaction.txid)
             return False
-        else:
+        if transaction.txid is None:
             self.update_seen_inputs(transaction)
             return True
+        # Package limits bound the work of a size-capped pool's evictions;
+        # an uncapped pool never evicts, so it takes any package
+        if self.spends_rejected(transaction) or (
+                self.max_weight is not None
+                and not self.within_package_limits(transaction)):
+            self.reject_transaction(transaction.txid)
+            return False
+        self.update_seen_inputs(transaction)
+        self._insert(transaction)
+        self.trim()
+        # The new transaction itself may have been evicted
+        return transaction.txid in self.transactions
+
+    def remove_transaction(self, txid):
+        transaction = self.transactions.get(txid)
+        if transaction is None:
+            return None
+        self._unlink(txid)
+        return transaction
+
+    def reject_transaction(self, txid):
+        # Spenders already in the pool leave with their packages
+        self._remember_reject(txid)
+        for child_txid in list(self.spenders.get(txid, ())):
+            if child_txid in self.transactions:
+                self._evict_package(child_txid)
+
+    def spends_rejected(self, transaction):
+        return any(to_bytes(vin['txid']).hex() in self.recent_rejects
+                   for vin in transaction.vin)
 
     def is_double_spending(self, transaction):
         for vin in transaction.vin:
@@ -21,3 +119,187 @@ class Mempool:
         for vin in transaction.vin:
             input_ref = (vin['txid'], vin['vout'])
             self.seen_inputs.add(input_ref)
+
+    def within_package_limits(self, transaction):
+        # The limits must hold for the new transaction and for every
+        # in-pool transaction it would become an ancestor or descendant of
+        ancestors = set()
+        for parent_txid in self._in_pool_parents(transaction):
+            ancestors.add(parent_txid)
+            ancestors |= self._ancestors(parent_txid)
+        if len(ancestors) + 1 > self.max_ancestors:
+            return False
+        descendants = self._spending_descendants(
+            transaction.txid, self.max_descendants)
+        if len(descendants) + 1 > self.max_descendants:
+            return False
+        new_package = descendants | {transaction.txid}
+        for ancestor_txid in ancestors:
+            if len(new_package.union(self._package(ancestor_txid))) > \
+                    self.max_descendants:
+                return False
+        new_ancestors = ancestors | {transaction.txid}
+        for descendant_txid in descendants:
+            if len(new_ancestors | self._ancestors(descendant_txid)) + 1 > \
+                    self.max_ancestors:
+                return False
+        return True
+
+    def get_min_fee_rate(self):
+        # Decay the floor by the time passed since it was last updated
+        if self._rolling_min_fee_rate:
+            now = self._clock()
+            elapsed = now - self._last_floor_update
+            if elapsed > 0:
+                self._rolling_min_fee_rate /= 2 ** (elapsed / FEE_FLOOR_HALFLIFE)
+                self._last_floor_update = now
+                if self._rolling_min_fee_rate < INCREMENTAL_FEE_RATE / 2:
+                    self._rolling_min_fee_rate = 0.0
+        return self._rolling_min_fee_rate
+
+    def meets_fee_floor(self, transaction):
+        return transaction.fee >= self.get_min_fee_rate() * transaction.weight
+
+    def trim(self):
+        # Evict the lowest descendant fee-rate packages until the pool fits
+        if self.max_weight is None:
+            return
+        while self.total_weight > self.max_weight and self._eviction_heap:
+            fee_rate, _, txid = heapq.heappop(self._eviction_heap)
+            stats = self.descendant_stats.get(txid)
+            if stats is None or stats[0] / stats[1] != fee_rate:
+                continue
+            self._evict_package(txid)
+            self._raise_fee_floor(fee_rate + INCREMENTAL_FEE_RATE)
+
+    def _raise_fee_floor(self, fee_rate):
+        if fee_rate > self.get_min_fee_rate():
+            self._rolling_min_fee_rate = fee_rate
+            self._last_floor_update = self._clock()
+
+    def _push(self, txid):
+        fee, weight = self.descendant_stats[txid]
+        self._sequence += 1
+        heapq.heappush(self._eviction_heap,
+                       (fee / weight, self._sequence, txid))
+        # Rebuild from live entries once stale ones dominate, keeping the
+        # heap O(n) in size
+        if len(self._eviction_heap) > 2 * len(self.descendant_stats) + 64:
+            self._eviction_heap = [
+                (fee / weight, sequence, txid)
+                for sequence, (txid, (fee, weight)) in enumerate(
+                    self.descendant_stats.items(), start=self._sequence + 1)]
+            self._sequence += len(self._eviction_heap)
+            heapq.heapify(self._eviction_heap)
+
+    def _in_pool_parents(self, transaction):
+        return {to_bytes(vin['txid']).hex()
+                for vin in transaction.vin} & self.transactions.keys()
+
+    # In-pool transactions spending txid's outputs directly or indirectly,
+    # collected until there are more than limit of them
+    def _spending_descendants(self, txid, limit):
+        descendants = set()
+        for child_txid in self.spenders.get(txid, ()):
+            if child_txid not in descendants:
+                descendants.update(self._package(child_txid))
+                if len(descendants) > limit:
+                    break
+        return descendants
+
+    def _ancestors(self, txid):
+        ancestors = set()
+        stack = list(self.parents[txid])
+        while stack:
+            parent_txid = stack.pop()
+            if parent_txid not in ancestors:
+                ancestors.add(parent_txid)
+                stack.extend(self.parents[parent_txid])
+        return ancestors
+
+    # The package rooted at txid in DFS post-order: every transaction comes
+    # after all of its descendants, with txid itself last
+    def _package(self, txid):
+        order = []
+        visited = {txid}
+        stack = [(txid, iter(self.children[txid]))]
+        while stack:
+            node, child_txids = stack[-1]
+            for child_txid in child_txids:
+                if child_txid not in visited:
+                    visited.add(child_txid)
+                    stack.append(
+                        (child_txid, iter(self.children[child_txid])))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        return order
+
+    def _insert(self, transaction):
+        txid = transaction.txid
+        self.transactions[txid] = transaction
+        self.total_weight += transaction.weight
+        parent_txids = self._in_pool_parents(transaction)
+        self.parents[txid] = parent_txids
+        for parent_txid in parent_txids:
+            self.children[parent_txid].add(txid)
+        for vin in transaction.vin:
+            self.spenders.setdefault(
+                to_bytes(vin['txid']).hex(), set()).add(txid)
+
+        # Spenders that arrived first become this transaction's children
+        self.children[txid] = set(self.spenders.get(txid, ()))
+        for child_txid in self.children[txid]:
+            self.parents[child_txid].add(txid)
+
+        # The packages of this transaction and of every ancestor now include
+        # it and its adopted descendants. An ancestor may already count some
+        # of those through another path, so the totals are recounted.
+        self._recount(txid)
+        for ancestor_txid in self._ancestors(txid):
+            self._recount(ancestor_txid)
+
+    def _recount(self, txid):
+        package = [self.transactions[package_txid]
+                   for package_txid in self._package(txid)]
+        self.descendant_stats[txid] = [
+            sum(transaction.fee for transaction in package),
+            sum(transaction.weight for transaction in package)]
+        self._push(txid)
+
+    def _unlink(self, txid):
+        transaction = self.transactions.pop(txid)
+        self.total_weight -= transaction.weight
+        for ancestor_txid in self._ancestors(txid):
+            stats = self.descendant_stats[ancestor_txid]
+            stats[0] -= transaction.fee
+            stats[1] -= transaction.weight
+            self._push(ancestor_txid)
+        for parent_txid in self.parents.pop(txid):
+            self.children[parent_txid].discard(txid)
+        # Remaining children now spend outputs that are no longer in the
+        # pool (mined, or about to be evicted with them)
+        for child_txid in self.children.pop(txid):
+            self.parents[child_txid].discard(txid)
+        del self.descendant_stats[txid]
+        for vin in transaction.vin:
+            self.seen_inputs.discard((vin['txid'], vin['vout']))
+            spent_txid = to_bytes(vin['txid']).hex()
+            spenders = self.spenders.get(spent_txid)
+            if spenders is not None:
+                spenders.discard(txid)
+                if not spenders:
+                    del self.spenders[spent_txid]
+
+    def _remember_reject(self, txid):
+        if len(self.recent_rejects) >= RECENT_REJECTS_SIZE:
+            # Forget the oldest entry
+            self.recent_rejects.pop(next(iter(self.recent_rejects)))
+        self.recent_rejects[txid] = None
+
+    def _evict_package(self, txid):
+        # Descendants go first so ancestor totals are updated exactly once
+        for package_txid in self._package(txid):
+            self._unlink(package_txid)
+            self._remember_reject(package_txid)
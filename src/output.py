@@ -0,0 +1,112 @@
+import json
+
+from serialize import serialize_varint, to_bytes
+
+
+# Output formats accepted by write_block_output
+OUTPUT_FORMATS = ("lines", "block", "block-hex", "getblocktemplate")
+
+# Block files are written through a buffer of this size
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+# The challenge output: header, serialized coinbase, then every txid with
+# the coinbase txid first.
+def format_output_lines(block):
+    output_lines = [block["header"].hex()]
+    # Add serialized coinbase transaction on line 2
+    output_lines.append(block["coinbase_serialized"])
+
+    # Append the txid of the coinbase transaction and other transactions
+    output_lines.append(block["coinbase_tx"].txid)
+    for tx in block["transactions"]:
+        output_lines.append(tx.txid)
+
+    return output_lines
+
+
+def write_output_lines(block, path):
+    with open(path, "w") as outfile:
+        for line in format_output_lines(block):
+            outfile.write(line + "\n")
+
+
+# Stream the fully serialized block (header, transaction count and every
+# transaction with witness data) to a file. Transactions are written one by
+# one from their cached serializations, so the block is never assembled in
+# memory. With hex_encoded=True the file holds the hex string accepted by
+# submitblock instead of raw bytes.
+def write_serialized_block(block, path, hex_encoded=False):
+    transactions = block["transactions"]
+    mode = "w" if hex_encoded else "wb"
+    with open(path, mode, buffering=WRITE_BUFFER_SIZE) as outfile:
+        def write(data):
+            outfile.write(data.hex() if hex_encoded else data)
+
+        write(block["header"])
+        # The coinbase transaction is counted along with the others
+        write(serialize_varint(len(transactions) + 1))
+        write(bytes.fromhex(block["coinbase_serialized"]))
+        for tx in transactions:
+            write(tx.serialize_bytes(include_witness=True))
+
+
+# Describe the block as a BIP22 getblocktemplate result. `depends` holds the
+# 1-based positions of in-block parents, as in the BIP.
+def build_getblocktemplate(block):
+    transactions = block["transactions"]
+    position_by_txid = {tx.txid: position
+                        for position, tx in enumerate(transactions, start=1)}
+
+    template_transactions = []
+    for tx in transactions:
+        parent_txids = {to_bytes(vin["txid"]).hex() for vin in tx.vin}
+        depends = sorted(position_by_txid[txid]
+                         for txid in parent_txids if txid in position_by_txid)
+        template_transactions.append({
+            "data": tx.serialize(include_witness=True),
+            "txid": tx.txid,
+            "hash": tx.get_wtxid_hash(),
+            "depends": depends,
+            "fee": tx.fee,
+            "sigops": tx.sigops,
+            "weight": tx.weight,
+        })
+
+    return {
+        "version": block["version"],
+        "rules": ["segwit"],
+        # The header stores the previous hash as given, zero-padded to 32
+        # bytes; BIP22 reports it in display (byte-reversed) order
+        "previousblockhash": bytes.fromhex(
+            block["previous_block_hash"]).ljust(32, b"\x00")[::-1].hex(),
+        "transactions": template_transactions,
+        "coinbasevalue": block["coinbase_value"],
+        "target": block["difficulty_target"],
+        "mutable": ["time", "transactions", "prevblock"],
+        "noncerange": "00000000ffffffff",
+        "sigoplimit": block["max_block_sigops"],
+        "weightlimit": block["max_block_weight"],
+        "curtime": block["timestamp"],
+        "bits": f"{block['bits']:08x}",
+        "height": block["height"],
+        "default_witness_commitment": block["coinbase_tx"].vout[1]["scriptpubkey"],
+    }
+
+
+def write_getblocktemplate(block, path):
+    with open(path, "w", buffering=WRITE_BUFFER_SIZE) as outfile:
+        json.dump(build_getblocktemplate(block), outfile)
+
+
+def write_block_output(block, path, output_format="lines"):
+    if output_format == "lines":
+        write_output_lines(block, path)
+    elif output_format == "block":
+        write_serialized_block(block, path)
+    elif output_format == "block-hex":
+        write_serialized_block(block, path, hex_encoded=True)
+    elif output_format == "getblocktemplate":
+        write_getblocktemplate(block, path)
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
@@ -0,0 +1,105 @@
+from serialize import to_bytes
+
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1 = 0x51
+OP_16 = 0x60
+OP_CHECKSIG = 0xac
+OP_CHECKSIGVERIFY = 0xad
+OP_CHECKMULTISIG = 0xae
+OP_CHECKMULTISIGVERIFY = 0xaf
+
+# A bare CHECKMULTISIG is counted as the maximum number of public keys
+MAX_PUBKEYS_PER_MULTISIG = 20
+# Legacy and P2SH sigops cost four times as much as witness sigops
+WITNESS_SCALE_FACTOR = 4
+
+
+# Walk a script and yield (opcode, push data) pairs. Parsing stops at the
+# first truncated push, as Bitcoin Core does when counting sigops.
+def iter_script_ops(script):
+    script = to_bytes(script)
+    i = 0
+    while i < len(script):
+        opcode = script[i]
+        i += 1
+        if opcode < OP_PUSHDATA1:
+            size = opcode
+        elif opcode == OP_PUSHDATA1:
+            if i + 1 > len(script):
+                return
+            size = script[i]
+            i += 1
+        elif opcode == OP_PUSHDATA2:
+            if i + 2 > len(script):
+                return
+            size = int.from_bytes(script[i:i + 2], 'little')
+            i += 2
+        elif opcode == OP_PUSHDATA4:
+            if i + 4 > len(script):
+                return
+            size = int.from_bytes(script[i:i + 4], 'little')
+            i += 4
+        else:
+            yield opcode, None
+            continue
+
+        if i + size > len(script):
+            return
+        yield opcode, script[i:i + size]
+        i += size
+
+
+# Count the signature operations in a script. With accurate=True a
+# CHECKMULTISIG preceded by OP_1..OP_16 counts as that many sigops, which
+# is how P2SH redeem scripts and witness scripts are counted.
+def count_script_sigops(script, accurate=False):
+    sigops = 0
+    last_opcode = None
+    for opcode, _ in iter_script_ops(script):
+        if opcode in (OP_CHECKSIG, OP_CHECKSIGVERIFY):
+            sigops += 1
+        elif opcode in (OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY):
+            if accurate and last_opcode is not None and OP_1 <= last_opcode <= OP_16:
+                sigops += last_opcode - OP_1 + 1
+            else:
+                sigops += MAX_PUBKEYS_PER_MULTISIG
+        last_opcode = opcode
+    return sigops
+
+
+# Return the data of the last push in a script, e.g. the redeem script at
+# the end of a P2SH scriptSig.
+def last_push_data(script):
+    data = None
+    for _, push in iter_script_ops(script):
+        data = push
+    return data
+
+
+def is_p2sh(script):
+    script = to_bytes(script)
+    return len(script) == 23 and script[:2] == b'\xa9\x14' and script[22] == 0x87
+
+
+def is_p2wpkh(script):
+    script = to_bytes(script)
+    return len(script) == 22 and script[:2] == b'\x00\x14'
+
+
+def is_p2wsh(script):
+    script = to_bytes(script)
+    return len(script) == 34 and script[:2] == b'\x00\x20'
+
+
+# Sigops spent by a version 0 witness program with the given witness stack
+def count_witness_sigops(witness_program, witness):
+    if is_p2wpkh(witness_program):
+        return 1
+    if is_p2wsh(witness_program) and witness:
+        # The witness script is the last item on the witness stack
+        return count_script_sigops(to_bytes(witness[-1]), accurate=True)
+    return 0
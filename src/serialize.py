@@ -1,6 +1,14 @@
 import struct
 
 
+# Return raw bytes for a field that may be either a hex string (as found in
+# the mempool JSON) or bytes already decoded by the fast loader.
+def to_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return bytes.fromhex(value)
+
+
 # Serialize an integer as a VarInt. VarInt, or Variable Integer, is a method of serializing integers using
 # one or more bytes. Smaller numbers take up a smaller number of bytes.
 def serialize_varint(i):
@@ -59,16 +67,16 @@ def deserialize_varint(data):
 # Serialize a transaction input.
 def serialize_txin(txin, script_override=None):
     # Previous Transaction Hash, 32 bytes (little-endian)
-    serialized = bytes.fromhex(txin['txid'])[::-1]  # Reverse byte order
+    serialized = to_bytes(txin['txid'])[::-1]  # Reverse byte order
     # Previous Transaction Output Index, 4 bytes (little-endian)
     serialized += txin['vout'].to_bytes(4, byteorder='little', signed=False)
     # ScriptSig Size, 1–9 bytes (VarInt)
     # Use script_override if provided for the purpose of signature
     # verification, otherwise use the scriptsig from txin
-    script_bytes = bytes.fromhex(
+    script_bytes = to_bytes(
         script_override if script_override is not None else txin.get(
             'scriptsig', ''))
-    scriptsig_bytes = bytes.fromhex(txin.get('scriptsig', ''))
+    scriptsig_bytes = to_bytes(txin.get('scriptsig', ''))
     # ScriptSig with its length
     serialized += serialize_varint(len(scriptsig_bytes)) + scriptsig_bytes
     # Sequence, 4 bytes (little-endian)
@@ -81,14 +89,15 @@ def serialize_txout(txout):
     # Amount, 8 bytes (little-endian)
     serialized = txout['value'].to_bytes(8, byteorder='little', signed=False)
     # Locking-Script Size, 1–9 bytes (VarInt)
-    scriptpubkey_bytes = bytes.fromhex(txout['scriptpubkey'])
+    scriptpubkey_bytes = to_bytes(txout['scriptpubkey'])
     serialized += serialize_varint(len(scriptpubkey_bytes)
                                    ) + scriptpubkey_bytes
     return serialized
 
 
-# Serialize a coinbase transaction.
-def serialize_coinbase_tx(coinbase_tx, block_height):
+# Serialize a coinbase transaction. Without witness data the result is
+# what the coinbase txid is computed from.
+def serialize_coinbase_tx(coinbase_tx, block_height, include_witness=True):
     # Serialize the transaction version as a 4-byte little-endian unsigned
     # integer.
     version = struct.pack("<L", coinbase_tx.version)
@@ -144,6 +153,14 @@ def serialize_coinbase_tx(coinbase_tx, block_height):
     # Serialize the locktime as a 4-byte little-endian unsigned integer.
     locktime = struct.pack("<L", coinbase_tx.locktime)
     # Combine all serialized parts of the coinbase transaction.
+    if not include_witness:
+        return (
+            version +
+            tx_in_count +
+            txins +
+            tx_out_count +
+            txouts +
+            locktime).hex()
     return (
         version +
         marker +
@@ -170,3 +187,58 @@ def serialize_block_height(block_height):
     push_opcode = len(height_bytes).to_bytes(1, 'little')
 
     return push_opcode + height_bytes
+
+
+# Deserialize one transaction from raw bytes starting at offset. Returns the
+# transaction as a dict in the same shape as load_transactions builds (hex
+# fields as bytes, txids in display order) and the offset just past it.
+def deserialize_transaction(data, offset=0):
+    view = memoryview(data)
+
+    def read(size):
+        nonlocal offset
+        if offset + size > len(view):
+            raise ValueError("Insufficient data for transaction decoding")
+        chunk = bytes(view[offset:offset + size])
+        offset += size
+        return chunk
+
+    def read_varint():
+        nonlocal offset
+        # A VarInt is at most 9 bytes long
+        chunk = bytes(view[offset:offset + 9])
+        value, remaining = deserialize_varint(chunk)
+        offset += len(chunk) - len(remaining)
+        return value
+
+    version = int.from_bytes(read(4), 'little')
+
+    # A zero input count followed by flag 0x01 marks a SegWit transaction
+    segwit = bytes(view[offset:offset + 2]) == b'\x00\x01'
+    if segwit:
+        offset += 2
+
+    vin = []
+    for _ in range(read_varint()):
+        txid = read(32)[::-1]  # Stored little-endian, kept in display order
+        vout = int.from_bytes(read(4), 'little')
+        scriptsig = read(read_varint())
+        sequence = int.from_bytes(read(4), 'little')
+        vin.append({'txid': txid, 'vout': vout,
+                   'scriptsig': scriptsig, 'sequence': sequence})
+
+    vout = []
+    for _ in range(read_varint()):
+        value = int.from_bytes(read(8), 'little')
+        vout.append({'value': value, 'scriptpubkey': read(read_varint())})
+
+    if segwit:
+        for txin in vin:
+            witness = [read(read_varint()) for _ in range(read_varint())]
+            # Inputs without witness data are serialized as an empty stack
+            if witness:
+                txin['witness'] = witness
+
+    locktime = int.from_bytes(read(4), 'little')
+    return {'version': version, 'locktime': locktime,
+            'vin': vin, 'vout': vout}, offset
@@ -0,0 +1,328 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+from accounting import INITIAL_BLOCK_SUBSIDY, HALVING_INTERVAL
+from block import build_block_template
+from hashing import hash256_bytes
+from load_transactions import (load_transactions, extract_transaction_fields,
+                               validate_transaction)
+from mempool import Mempool
+from output import build_getblocktemplate
+from serialize import deserialize_transaction, serialize_varint
+from transaction import Transaction
+from validate_block import BlockValidator, split_raw_block, transaction_summary
+
+
+# JSON-RPC error codes, using Bitcoin Core's values where it defines them
+RPC_PARSE_ERROR = -32700
+RPC_INVALID_REQUEST = -32600
+RPC_METHOD_NOT_FOUND = -32601
+RPC_INVALID_PARAMS = -32602
+RPC_INTERNAL_ERROR = -32603
+RPC_DESERIALIZATION_ERROR = -22
+RPC_VERIFY_REJECTED = -26
+
+
+class RPCError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class TemplateServer:
+    """Keeps the validated pool and the last block template in memory.
+
+    The getblocktemplate result is cached as encoded JSON and rebuilt only
+    when the pool or the chain tip changes.
+    """
+
+    def __init__(
+            self,
+            mempool,
+            bitcoin_address,
+            previous_block_hash,
+            difficulty_target,
+            block_height,
+            block_subsidy,
+            initial_subsidy=INITIAL_BLOCK_SUBSIDY,
+            halving_interval=HALVING_INTERVAL):
+        self.mempool = mempool
+        self.bitcoin_address = bitcoin_address
+        self.previous_block_hash = previous_block_hash
+        self.difficulty_target = difficulty_target
+        self.block_height = block_height
+        self.block_subsidy = block_subsidy
+        self.initial_subsidy = initial_subsidy
+        self.halving_interval = halving_interval
+        # Serializes pool and tip updates and template rebuilds
+        self._lock = threading.RLock()
+        # Bumped on every pool change; part of the template cache key
+        self._pool_version = 0
+        # (cache key, encoded template), replaced as a whole so readers can
+        # check it without taking the lock
+        self._cached_template = None
+        self._seen_blocks = set()
+        # Prevouts come from the pool, so only the block-level checks are
+        # used and the mempool directory is never read
+        self._validator = BlockValidator(
+            workers=1,
+            initial_subsidy=initial_subsidy,
+            halving_interval=halving_interval)
+
+    def _template_key(self):
+        return (self._pool_version, self.previous_block_hash,
+                self.block_height)
+
+    def invalidate_template(self):
+        with self._lock:
+            self._pool_version += 1
+
+    def getblocktemplate(self):
+        cached = self._cached_template
+        if cached is not None and cached[0] == self._template_key():
+            return cached[1]
+
+        with self._lock:
+            # Another request may have rebuilt it while we waited
+            key = self._template_key()
+            cached = self._cached_template
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+            block = build_block_template(
+                list(self.mempool.transactions.values()),
+                self.bitcoin_address,
+                self.previous_block_hash,
+                self.difficulty_target,
+                self.block_height,
+                self.block_subsidy,
+                initial_subsidy=self.initial_subsidy,
+                halving_interval=self.halving_interval)
+            encoded = json.dumps(build_getblocktemplate(block))
+            self._cached_template = (key, encoded)
+            return encoded
+
+    def submittransaction(self, tx_data):
+        # Accept the transaction as a mempool-file JSON object or its text
+        try:
+            if isinstance(tx_data, str):
+                tx_data = json.loads(tx_data)
+            if not isinstance(tx_data, dict):
+                raise TypeError("expected a transaction object")
+            transaction = Transaction(extract_transaction_fields(tx_data))
+            # The fee-rate floor is checked before the costlier script and
+            # signature checks
+            with self._lock:
+                if not self.mempool.meets_fee_floor(transaction):
+                    raise RPCError(RPC_VERIFY_REJECTED,
+                                   "mempool min fee not met")
+            is_valid = validate_transaction(transaction)
+        except (AttributeError, IndexError, KeyError, OverflowError,
+                TypeError, ValueError) as e:
+            raise RPCError(RPC_DESERIALIZATION_ERROR,
+                           f"TX decode failed: {e}")
+        if not transaction.vin:
+            raise RPCError(RPC_VERIFY_REJECTED, "bad-txns-vin-empty")
+        if not transaction.vout:
+            raise RPCError(RPC_VERIFY_REJECTED, "bad-txns-vout-empty")
+        if transaction.fee < 0:
+            raise RPCError(RPC_VERIFY_REJECTED, "bad-txns-in-belowout")
+        if not is_valid:
+            raise RPCError(RPC_VERIFY_REJECTED, "tx-validation-failed")
+
+        with self._lock:
+            if transaction.txid in self.mempool.transactions:
+                raise RPCError(RPC_VERIFY_REJECTED, "txn-already-in-mempool")
+            if self.mempool.is_double_spending(transaction):
+                raise RPCError(RPC_VERIFY_REJECTED, "txn-mempool-conflict")
+            # A bounded pool may evict the new transaction straight away
+            if not self.mempool.add_transaction(transaction):
+                raise RPCError(RPC_VERIFY_REJECTED, "mempool full")
+            self.invalidate_template()
+        return transaction.txid
+
+    # Summaries of a block's non-coinbase transactions for the block
+    # checks, taken from the pool since that is where the prevouts are. A
+    # transaction that is not in the pool, or whose witness differs from
+    # the pool copy, has no summary.
+    def _summarize_block_transactions(self, raw_transactions):
+        summaries = []
+        for raw_tx in raw_transactions:
+            data, _ = deserialize_transaction(raw_tx)
+            transaction = Transaction(data)
+            txid = hash256_bytes(transaction.serialize_bytes(
+                include_witness=False))[::-1].hex()
+            pool_transaction = self.mempool.transactions.get(txid)
+            if (pool_transaction is None
+                    or pool_transaction.serialize_bytes() != raw_tx):
+                summaries.append(None)
+                continue
+            # Pool transactions were fully validated on the way in
+            summaries.append(transaction_summary(
+                pool_transaction, pool_transaction.fee, True))
+        return summaries
+
+    # Returns None when the block is accepted, otherwise a BIP22 reject
+    # reason. An accepted block becomes the new tip and its transactions
+    # leave the pool.
+    def submitblock(self, block_hex):
+        try:
+            header, raw_transactions = split_raw_block(bytes.fromhex(block_hex))
+        except (IndexError, TypeError, ValueError):
+            raise RPCError(RPC_DESERIALIZATION_ERROR, "Block decode failed")
+        if len(header) != 80 or not raw_transactions:
+            raise RPCError(RPC_DESERIALIZATION_ERROR, "Block decode failed")
+
+        block_hash = hash256_bytes(header)
+        with self._lock:
+            if block_hash in self._seen_blocks:
+                return "duplicate"
+            expected_prev = bytes.fromhex(
+                self.previous_block_hash).ljust(32, b"\x00")
+            if header[4:36] != expected_prev:
+                return "bad-prevblk"
+            if int.from_bytes(block_hash, 'little') >= int(
+                    self.difficulty_target, 16):
+                return "high-hash"
+
+            # Merkle root, coinbase, witness commitment, limits and fees
+            # must all hold before the tip or the pool change
+            summaries = self._summarize_block_transactions(
+                raw_transactions[1:])
+            errors = self._validator.check_block(
+                header, raw_transactions[0], summaries, self.block_height,
+                self.block_subsidy,
+                tx_count_size=len(serialize_varint(len(raw_transactions))),
+                unconfirmed_txids=self.mempool.transactions)
+            if errors:
+                return errors[0]
+
+            self._seen_blocks.add(block_hash)
+            # The coinbase is first and never in the pool
+            for summary in summaries:
+                self.mempool.remove_transaction(summary['txid'])
+            # Header fields are stored as given, so the new tip is kept in
+            # the same (internal) byte order
+            self.previous_block_hash = block_hash.hex()
+            self.block_height += 1
+            self.invalidate_template()
+        return None
+
+    def handle_rpc(self, body):
+        """Handle one JSON-RPC request body and return the encoded reply."""
+        request_id = None
+        try:
+            try:
+                request = json.loads(body)
+            except ValueError:
+                raise RPCError(RPC_PARSE_ERROR, "Parse error")
+            if not isinstance(request, dict) or "method" not in request:
+                raise RPCError(RPC_INVALID_REQUEST, "Invalid request")
+            request_id = request.get("id")
+            method = request["method"]
+            params = request.get("params") or []
+            if not isinstance(params, list):
+                raise RPCError(RPC_INVALID_PARAMS, "Params must be a list")
+
+            if method == "getblocktemplate":
+                # The template is already encoded, so splice it in as is
+                return ('{"result": %s, "error": null, "id": %s}'
+                        % (self.getblocktemplate(), json.dumps(request_id)))
+            elif method == "submittransaction":
+                if len(params) != 1 or not isinstance(params[0], (dict, str)):
+                    raise RPCError(RPC_INVALID_PARAMS,
+                                   "Expected one transaction")
+                result = self.submittransaction(params[0])
+            elif method == "submitblock":
+                if len(params) < 1 or not isinstance(params[0], str):
+                    raise RPCError(RPC_INVALID_PARAMS,
+                                   "Expected a hex-encoded block")
+                result = self.submitblock(params[0])
+            else:
+                raise RPCError(RPC_METHOD_NOT_FOUND, "Method not found")
+        except RPCError as e:
+            return json.dumps({"result": None,
+                               "error": {"code": e.code, "message": e.message},
+                               "id": request_id})
+        except Exception:
+            # A bug must not take the connection down with it
+            logging.exception("Unhandled error in JSON-RPC request")
+            return json.dumps({"result": None,
+                               "error": {"code": RPC_INTERNAL_ERROR,
+                                         "message": "Internal error"},
+                               "id": request_id})
+        return json.dumps({"result": result, "error": None, "id": request_id})
+
+
+class RPCRequestHandler(BaseHTTPRequestHandler):
+    # Keep connections open so mining clients can poll without reconnecting
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_error(400, "Invalid Content-Length")
+            return
+        body = self.rfile.read(length)
+        response = self.server.template_server.handle_rpc(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+def create_template_server(
+        mempool_path,
+        bitcoin_address,
+        previous_block_hash,
+        difficulty_target,
+        block_height,
+        block_subsidy,
+        max_pool_weight=None,
+        initial_subsidy=INITIAL_BLOCK_SUBSIDY,
+        halving_interval=HALVING_INTERVAL):
+    mempool = Mempool(max_pool_weight)
+    load_transactions(mempool_path, mempool=mempool)
+    return TemplateServer(
+        mempool,
+        bitcoin_address,
+        previous_block_hash,
+        difficulty_target,
+        block_height,
+        block_subsidy,
+        initial_subsidy,
+        halving_interval)
+
+
+# Bind the JSON-RPC server to localhost. Pass port 0 to pick a free port;
+# the chosen one is in server.server_address.
+def make_rpc_server(template_server, host="127.0.0.1", port=8332):
+    server = ThreadingHTTPServer((host, port), RPCRequestHandler)
+    server.daemon_threads = True
+    server.template_server = template_server
+    return server
+
+
+# Minimal JSON-RPC client, e.g. for driving the server from a local script
+def rpc_call(url, method, params=None, request_id=0):
+    body = json.dumps({"method": method, "params": params or [],
+                       "id": request_id}).encode()
+    request = Request(url, data=body,
+                      headers={"Content-Type": "application/json"})
+    with urlopen(request) as response:
+        reply = json.loads(response.read())
+    if reply["error"] is not None:
+        raise RPCError(reply["error"]["code"], reply["error"]["message"])
+    return reply["result"]
+
@@ -1,8 +1,10 @@
 import hashlib
 
-from serialize import serialize_txin, serialize_txout, serialize_varint, deserialize_varint
+from serialize import serialize_txin, serialize_txout, serialize_varint, deserialize_varint, to_bytes
 from verify_address import get_hash_from_prevout, derive_address_from_hash
-from hashing import hash256
+from hashing import hash256, hash256_bytes
+from script import (count_script_sigops, count_witness_sigops, is_p2sh,
+                    last_push_data, WITNESS_SCALE_FACTOR)
 
 
 class Transaction:
@@ -18,14 +20,24 @@ class Transaction:
             # For regular transactions, derive witnesses from vin
             self.witnesses = [vin.get('witness', []) for vin in self.vin]
         self.txid = txid
-        # self.serialized = self.serialize(include_witness=True)
+        # Serializations keyed by include_witness, so weight, txid, wtxid and
+        # block output all share a single encoding of the transaction
+        self._serialized = {}
         self.weight = self.calculate_weight()
         self.fee = self.calculate_fee()
+        self.sigops = self.calculate_sigops()
 
     def is_segwit(self):
         return any(witness for witness in self.witnesses)
 
     def serialize(self, include_witness=True):
+        return self.serialize_bytes(include_witness).hex()
+
+    def serialize_bytes(self, include_witness=True):
+        cached = self._serialized.get(include_witness)
+        if cached is not None:
+            return cached
+
         # Start with serializing the transaction version as a 4-byte
         # little-endian integer.
         serialized = self.version.to_bytes(4, byteorder='little')
@@ -62,7 +74,7 @@ class Transaction:
                     # public key).
                     serialized += serialize_varint(len(vin['witness']))
                     for witness in vin['witness']:
-                        witness_bytes = bytes.fromhex(witness)
+                        witness_bytes = to_bytes(witness)
                         serialized += serialize_varint(
                             len(witness_bytes)) + witness_bytes
                 else:
@@ -74,9 +86,8 @@ class Transaction:
         # integer.
         serialized += self.locktime.to_bytes(4, byteorder='little')
 
-        # Convert the entire serialized transaction to a hexadecimal string for
-        # easy transmission or storage.
-        return serialized.hex()
+        self._serialized[include_witness] = serialized
+        return serialized
 
     def is_valid(self):
         if not self.verify_addresses():
@@ -100,14 +111,10 @@ class Transaction:
 
     def calculate_weight(self, ):
         # Serialize the transaction without witness data for the base size
-        serialized_without_witness = self.serialize(include_witness=False)
-        # Divided by 2 because the hex string represents 2 hex digits per byte
-        base_size = len(serialized_without_witness) // 2
+        base_size = len(self.serialize_bytes(include_witness=False))
 
         # Serialize the transaction with witness data for the total size
-        serialized_with_witness = self.serialize(include_witness=True)
-        # Similarly, divided by 2
-        total_size = len(serialized_with_witness) // 2
+        total_size = len(self.serialize_bytes(include_witness=True))
 
         # Apply the weight formula
         weight = (base_size * 3) + total_size
@@ -125,6 +132,39 @@ class Transaction:
             # output values.
             return total_input_value - total_output_value
 
+    def calculate_sigops(self):
+        # Legacy sigops in every scriptSig and scriptPubKey, scaled by the
+        # witness scale factor
+        legacy_sigops = sum(count_script_sigops(vin.get('scriptsig', ''))
+                            for vin in self.vin)
+        legacy_sigops += sum(count_script_sigops(vout['scriptpubkey'])
+                             for vout in self.vout)
+        sigop_cost = legacy_sigops * WITNESS_SCALE_FACTOR
+        if self.is_coinbase:
+            return sigop_cost
+
+        for vin in self.vin:
+            # P2SH and witness sigops depend on the spent output, which is
+            # unknown for transactions decoded from a raw block
+            if 'prevout' not in vin:
+                continue
+            prevout_script = vin['prevout']['scriptpubkey']
+            witness_program = prevout_script
+            if is_p2sh(prevout_script):
+                # P2SH sigops are counted in the redeem script, which is the
+                # last push of the scriptSig
+                redeem_script = last_push_data(vin.get('scriptsig', ''))
+                if redeem_script is None:
+                    continue
+                sigop_cost += count_script_sigops(
+                    redeem_script, accurate=True) * WITNESS_SCALE_FACTOR
+                # A P2SH-wrapped SegWit input spends the redeem script as its
+                # witness program
+                witness_program = redeem_script
+            sigop_cost += count_witness_sigops(
+                witness_program, vin.get('witness', []))
+        return sigop_cost
+
     def get_wtxid(self):
         # Serialize the transaction including its witness data
         serialized_tx_with_witness = self.serialize(include_witness=True)
@@ -132,3 +172,7 @@ class Transaction:
         # and return the result as a hexadecimal string
         # return hash256(serialized_tx_with_witness)
         return serialized_tx_with_witness
+
+    def get_wtxid_hash(self):
+        # Witness transaction ID in the usual (byte-reversed) display order
+        return hash256_bytes(self.serialize_bytes(include_witness=True))[::-1].hex()
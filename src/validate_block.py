@@ -0,0 +1,350 @@
+import hashlib
+import logging
+import os
+
+from accounting import (get_block_subsidy, MAX_BLOCK_WEIGHT,
+                        MAX_BLOCK_SIGOPS_COST, INITIAL_BLOCK_SUBSIDY,
+                        HALVING_INTERVAL)
+from hashing import hash256_bytes, merkle_root_from_hashes
+from load_transactions import decode_transaction_file
+from script import iter_script_ops, WITNESS_SCALE_FACTOR
+from serialize import (deserialize_transaction, deserialize_varint,
+                       serialize_varint, to_bytes)
+from transaction import Transaction
+
+
+# OP_RETURN, push 36 bytes, then the witness commitment tag (BIP141)
+WITNESS_COMMITMENT_HEADER = bytes.fromhex("6a24aa21a9ed")
+# Blocks with fewer transactions are checked in-process; below this the
+# worker processes cost more than they save
+PARALLEL_MIN_TRANSACTIONS = 256
+# Per-transaction results kept between validations
+SUMMARY_CACHE_SIZE = 65536
+
+
+# Expand the compact 'bits' header field into the full target
+def compact_to_target(bits):
+    exponent = bits >> 24
+    mantissa = bits & 0x007fffff
+    if exponent <= 3:
+        return mantissa >> (8 * (3 - exponent))
+    return mantissa << (8 * (exponent - 3))
+
+
+# Read the BIP34 block height pushed at the start of the coinbase scriptSig
+def get_coinbase_height(scriptsig):
+    for _, data in iter_script_ops(scriptsig):
+        if data is None:
+            return None
+        return int.from_bytes(data, 'little')
+    return None
+
+
+def mempool_file_path(mempool_path, txid):
+    # Mempool files are named after the SHA-256 of the txid bytes
+    filename = hashlib.sha256(bytes.fromhex(txid)).hexdigest() + '.json'
+    return os.path.join(mempool_path, filename)
+
+
+def summarize_transaction(data):
+    """Hashes and per-transaction figures the block checks need."""
+    transaction = Transaction(data)
+    if not all('prevout' in vin for vin in transaction.vin):
+        return transaction_summary(transaction, None, None)
+    return transaction_summary(
+        transaction, transaction.fee, transaction.is_valid())
+
+
+# fee and valid are None when the prevouts are unknown
+def transaction_summary(transaction, fee, valid):
+    txid = hash256_bytes(
+        transaction.serialize_bytes(include_witness=False))[::-1].hex()
+    return {
+        'txid': txid,
+        # Internal byte order, ready for the witness Merkle tree
+        'wtxid': hash256_bytes(
+            transaction.serialize_bytes(include_witness=True)),
+        'has_witness': transaction.is_segwit(),
+        'weight': transaction.weight,
+        'sigops': transaction.sigops,
+        'fee': fee,
+        'valid': valid,
+        'inputs': [(to_bytes(vin['txid']).hex(), vin['vout'])
+                   for vin in transaction.vin],
+    }
+
+
+# Worker for one transaction. A job is (mempool_path, txid, raw_tx): with
+# raw_tx the transaction comes from a block and only its prevouts are read
+# from the mempool; otherwise it is loaded from the mempool by txid.
+def _summarize_job(job):
+    mempool_path, txid, raw_tx = job
+    try:
+        if raw_tx is None:
+            file_path = mempool_file_path(mempool_path, txid)
+            if not os.path.exists(file_path):
+                return None
+            return summarize_transaction(decode_transaction_file(file_path))
+
+        data, _ = deserialize_transaction(raw_tx)
+        txid = hash256_bytes(
+            Transaction(data).serialize_bytes(include_witness=False))[::-1].hex()
+        file_path = mempool_file_path(mempool_path, txid)
+        if os.path.exists(file_path):
+            file_vin = decode_transaction_file(file_path)['vin']
+            for vin, known_vin in zip(data['vin'], file_vin):
+                if (vin['txid'], vin['vout']) == (known_vin['txid'],
+                                                  known_vin['vout']):
+                    vin['prevout'] = known_vin['prevout']
+        return summarize_transaction(data)
+    except (KeyError, ValueError):
+        return None
+
+
+def read_output_file(path):
+    """Split an output.txt into header, coinbase and the listed txids."""
+    with open(path) as file:
+        lines = [line.strip() for line in file if line.strip()]
+    if len(lines) < 3:
+        raise ValueError("Output file needs a header, coinbase and txids")
+    return bytes.fromhex(lines[0]), bytes.fromhex(lines[1]), lines[2:]
+
+
+# Split a raw block into its header and the raw bytes of each transaction,
+# which are the cache keys and the work units for the per-tx checks
+def split_raw_block(raw_block):
+    header = bytes(raw_block[:80])
+    chunk = bytes(raw_block[80:89])
+    tx_count, remaining = deserialize_varint(chunk)
+    offset = 80 + len(chunk) - len(remaining)
+
+    raw_transactions = []
+    for _ in range(tx_count):
+        _, end = deserialize_transaction(raw_block, offset)
+        raw_transactions.append(bytes(raw_block[offset:end]))
+        offset = end
+    if offset != len(raw_block):
+        raise ValueError("Unexpected trailing data after the last transaction")
+    return header, raw_transactions
+
+
+class BlockValidator:
+    """Independently re-checks a produced block.
+
+    Per-transaction work (decoding, hashing, weight, sigops, fees) runs in
+    worker processes for large blocks and is cached between calls, so the
+    validator can gate every template. Prevouts are read from the mempool
+    directory. validate_* methods return a list of BIP22-style reject
+    reasons; an empty list means the block is valid. block_subsidy is in
+    satoshis and defaults to the halving schedule, given by initial_subsidy
+    and halving_interval, at the block height.
+    """
+
+    def __init__(self, mempool_path='mempool/', workers=None,
+                 max_block_weight=MAX_BLOCK_WEIGHT,
+                 max_block_sigops=MAX_BLOCK_SIGOPS_COST,
+                 initial_subsidy=INITIAL_BLOCK_SUBSIDY,
+                 halving_interval=HALVING_INTERVAL):
+        self.mempool_path = mempool_path
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.max_block_weight = max_block_weight
+        self.max_block_sigops = max_block_sigops
+        self.initial_subsidy = initial_subsidy
+        self.halving_interval = halving_interval
+        self._executor = None
+        self._summaries = {}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _summarize(self, jobs, cache_keys):
+        summaries = [self._summaries.get(key) for key in cache_keys]
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        missing_jobs = [jobs[i] for i in missing]
+
+        if self.workers > 1 and len(missing_jobs) >= PARALLEL_MIN_TRANSACTIONS:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            chunksize = max(1, len(missing_jobs) // (self.workers * 4))
+            results = self._executor.map(
+                _summarize_job, missing_jobs, chunksize=chunksize)
+        else:
+            results = map(_summarize_job, missing_jobs)
+
+        for i, summary in zip(missing, results):
+            summaries[i] = summary
+            if summary is not None:
+                if len(self._summaries) >= SUMMARY_CACHE_SIZE:
+                    # Evict the oldest entry
+                    self._summaries.pop(next(iter(self._summaries)))
+                self._summaries[cache_keys[i]] = summary
+        return summaries
+
+    def validate_output_file(self, path, block_height=None,
+                             block_subsidy=None):
+        try:
+            header, coinbase_raw, txids = read_output_file(path)
+        except ValueError:
+            return ["bad-output-format"]
+        jobs = [(self.mempool_path, txid, None) for txid in txids[1:]]
+        summaries = self._summarize(jobs, txids[1:])
+        errors = []
+        if any(summary is not None and summary['txid'] != txid
+               for summary, txid in zip(summaries, txids[1:])):
+            errors.append("bad-txns-txid-mismatch")
+        return errors + self.check_block(
+            header, coinbase_raw, summaries, block_height, block_subsidy,
+            listed_coinbase_txid=txids[0])
+
+    def validate_raw_block(self, raw_block, block_height=None,
+                           block_subsidy=None):
+        try:
+            header, raw_transactions = split_raw_block(raw_block)
+        except ValueError:
+            return ["bad-blk-decode"]
+        if not raw_transactions:
+            return ["bad-blk-length"]
+        jobs = [(self.mempool_path, None, raw_tx)
+                for raw_tx in raw_transactions[1:]]
+        summaries = self._summarize(jobs, raw_transactions[1:])
+        return self.check_block(
+            header, raw_transactions[0], summaries, block_height,
+            block_subsidy, tx_count_size=len(
+                serialize_varint(len(raw_transactions))))
+
+    # Checks a block from per-transaction summaries. unconfirmed_txids
+    # holds the txids of unconfirmed transactions; when None, they are the
+    # transactions in the mempool directory.
+    def check_block(self, header, coinbase_raw, summaries, block_height,
+                    block_subsidy, listed_coinbase_txid=None,
+                    tx_count_size=None, unconfirmed_txids=None):
+        errors = []
+
+        # Each reason is reported once, with the first offender logged
+        def reject(reason, detail=None):
+            if reason in errors:
+                return
+            errors.append(reason)
+            if detail is not None:
+                logging.info(f"Block check {reason}: {detail}")
+
+        # Proof of work against the target encoded in the header
+        if len(header) != 80:
+            return ["bad-header-length"]
+        target = compact_to_target(int.from_bytes(header[72:76], 'little'))
+        if int.from_bytes(hash256_bytes(header), 'little') >= target:
+            reject("high-hash")
+
+        # Coinbase: a single input spending the null outpoint
+        try:
+            coinbase_data, end = deserialize_transaction(coinbase_raw)
+        except ValueError:
+            return errors + ["bad-cb-decode"]
+        if end != len(coinbase_raw):
+            reject("bad-cb-decode")
+        coinbase_vin = coinbase_data['vin']
+        if (len(coinbase_vin) != 1
+                or coinbase_vin[0]['txid'] != bytes(32)
+                or coinbase_vin[0]['vout'] != 0xffffffff):
+            return errors + ["bad-cb-missing"]
+        coinbase_tx = Transaction(coinbase_data, is_coinbase=True)
+        coinbase_txid = hash256_bytes(
+            coinbase_tx.serialize_bytes(include_witness=False))[::-1].hex()
+        if listed_coinbase_txid is not None and listed_coinbase_txid != coinbase_txid:
+            reject("bad-cb-txid", listed_coinbase_txid)
+
+        if any(summary is None for summary in summaries):
+            reject("bad-txns-unknown")
+        known = [summary for summary in summaries if summary is not None]
+
+        # Merkle root over the coinbase txid and every other txid
+        txids = [coinbase_txid] + [summary['txid'] for summary in known]
+        if len(set(txids)) != len(txids):
+            reject("bad-txns-duplicate")
+        merkle_root = merkle_root_from_hashes(
+            b''.join(bytes.fromhex(txid)[::-1] for txid in txids))
+        if merkle_root != header[36:68]:
+            reject("bad-txnmrklroot")
+
+        # BIP34 height
+        coinbase_height = get_coinbase_height(coinbase_vin[0]['scriptsig'])
+        if coinbase_height is None or (
+                block_height is not None and coinbase_height != block_height):
+            reject("bad-cb-height", coinbase_height)
+        if block_height is None:
+            block_height = coinbase_height or 0
+
+        # Witness commitment in the last output carrying the BIP141 tag
+        commitments = [vout['scriptpubkey'] for vout in coinbase_data['vout']
+                       if vout['scriptpubkey'][:6] == WITNESS_COMMITMENT_HEADER
+                       and len(vout['scriptpubkey']) >= 38]
+        if commitments:
+            coinbase_witness = coinbase_vin[0].get('witness', [])
+            if len(coinbase_witness) != 1 or len(coinbase_witness[0]) != 32:
+                reject("bad-witness-nonce-size")
+            else:
+                witness_root = merkle_root_from_hashes(
+                    bytes(32) + b''.join(summary['wtxid'] for summary in known))
+                expected = hash256_bytes(witness_root + coinbase_witness[0])
+                if commitments[-1][6:38] != expected:
+                    reject("bad-witness-merkle-match")
+        elif any(summary['has_witness'] for summary in known):
+            reject("unexpected-witness")
+
+        # Weight and sigop limits
+        if tx_count_size is None:
+            tx_count_size = len(serialize_varint(len(summaries) + 1))
+        block_weight = (80 + tx_count_size) * WITNESS_SCALE_FACTOR + \
+            coinbase_tx.weight + sum(summary['weight'] for summary in known)
+        if block_weight > self.max_block_weight:
+            reject("bad-blk-weight", block_weight)
+        block_sigops = coinbase_tx.sigops + \
+            sum(summary['sigops'] for summary in known)
+        if block_sigops > self.max_block_sigops:
+            reject("bad-blk-sigops", block_sigops)
+
+        # Per-transaction results, double spends and parent-before-child
+        # ordering. An unconfirmed parent must appear earlier in the block.
+        positions = {summary['txid']: position
+                     for position, summary in enumerate(known)}
+        if unconfirmed_txids is None:
+            def is_unconfirmed(txid):
+                return os.path.exists(
+                    mempool_file_path(self.mempool_path, txid))
+        else:
+            is_unconfirmed = unconfirmed_txids.__contains__
+        spent = set()
+        total_fees = 0
+        for position, summary in enumerate(known):
+            if summary['fee'] is None:
+                reject("bad-txns-inputs-missingorspent", summary['txid'])
+            elif summary['fee'] < 0:
+                reject("bad-txns-in-belowout", summary['txid'])
+            else:
+                total_fees += summary['fee']
+            if summary['valid'] is False:
+                reject("bad-txns-verify", summary['txid'])
+            for outpoint in summary['inputs']:
+                if outpoint in spent:
+                    reject("bad-txns-inputs-duplicate", summary['txid'])
+                spent.add(outpoint)
+                parent_position = positions.get(outpoint[0])
+                if parent_position is not None and parent_position >= position:
+                    reject("bad-txns-parent-order", summary['txid'])
+                elif parent_position is None and is_unconfirmed(outpoint[0]):
+                    reject("bad-txns-inputs-missingorspent", summary['txid'])
+
+        # The coinbase may claim at most the subsidy plus the fees, all in
+        # satoshis
+        if block_subsidy is None:
+            block_subsidy = get_block_subsidy(
+                block_height, self.initial_subsidy, self.halving_interval)
+        coinbase_value = sum(vout['value'] for vout in coinbase_data['vout'])
+        if coinbase_value > block_subsidy + total_fees:
+            reject("bad-cb-amount", coinbase_value)
+
+        return errors
+
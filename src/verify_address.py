@@ -1,7 +1,7 @@
-import base58
-import bech32
 import hashlib
 
+from serialize import to_bytes
+
 
 def calculate_checksum(version_byte, hash_bytes):
     """Calculate the checksum for a given version byte and hash bytes."""
@@ -16,6 +16,8 @@ def base58check_encode(version_byte, hash_bytes):
     """Encode version byte and hash bytes into a Base58Check format."""
     checksum = calculate_checksum(version_byte, hash_bytes)
     payload = version_byte + hash_bytes + checksum
+    # Address libraries load on first use rather than with the module
+    import base58
     return base58.b58encode(payload).decode('utf-8')
 
 
@@ -50,11 +52,15 @@ def base58check_encode(version_byte, hash_bytes):
             hash_bytes).digest()).digest()[
         :4]
     payload = version_byte + hash_bytes + checksum
+    # Address libraries load on first use rather than with the module
+    import base58
     return base58.b58encode(payload).decode('utf-8')
 
 
 # Encode a Bech32 address.
 def bech32_encode(hrp, version, program):
+    import bech32
+
     # Prepare the data payload: version + program (5-bit representation)
     data = [version] + bech32.convertbits(program, 8, 5, pad=True)
     if data is None:
@@ -69,23 +75,28 @@ def bech32_encode(hrp, version, program):
 
 
 def get_hash_from_prevout(prevout, tx_type):
-    if tx_type in ["p2pkh", "p2sh"]:
-        # Extract for traditional address types using the OP code method
-        parts = prevout["scriptpubkey_asm"].split(" ")
-        index = parts.index("OP_PUSHBYTES_20") + 1
-        return parts[index] if len(parts) > index else None
+    # The scriptPubKey may be a hex string or bytes from the fast loader
+    script = to_bytes(prevout["scriptpubkey"])
+    if tx_type == "p2pkh":
+        # P2PKH scriptpubkey format: OP_DUP OP_HASH160 OP_PUSHBYTES_20
+        # {20-byte pubkey hash} OP_EQUALVERIFY OP_CHECKSIG
+        if script[:3] == b"\x76\xa9\x14" and len(script) >= 23:
+            return script[3:23].hex()
+    elif tx_type == "p2sh":
+        # P2SH scriptpubkey format: OP_HASH160 OP_PUSHBYTES_20
+        # {20-byte script hash} OP_EQUAL
+        if script[:2] == b"\xa9\x14" and len(script) >= 22:
+            return script[2:22].hex()
     elif tx_type == "v0_p2wpkh":
         # Extract the pubkey hash for P2WPKH, which is embedded in the
         # scriptPubKey
-        script = prevout["scriptpubkey"]
         # P2WPKH scriptpubkey format: "0014{20-byte pubkey hash}"
-        if script.startswith("0014"):
-            return script[4:]  # Extract and return the pubkey hash
+        if script[:2] == b"\x00\x14":
+            return script[2:].hex()  # Extract and return the pubkey hash
     elif tx_type == "v0_p2wsh":
         # Extract the script hash for P2WSH, which is embedded in the
         # scriptPubKey
-        script = prevout["scriptpubkey"]
         # P2WSH scriptpubkey format: "0020{32-byte script hash}"
-        if script.startswith("0020"):
-            return script[4:]  # Extract and return the script hash
+        if script[:2] == b"\x00\x20":
+            return script[2:].hex()  # Extract and return the script hash
     return None
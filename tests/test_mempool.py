@@ -0,0 +1,87 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from mempool import Mempool, FEE_FLOOR_HALFLIFE, INCREMENTAL_FEE_RATE  # noqa: E402
+
+
+# A stand-in for Transaction with just the fields the pool reads. Without
+# parents it spends a unique confirmed output; each input spends output
+# `number` of its parent, so siblings never conflict.
+def make_tx(number, fee, weight, parents=()):
+    vin = [{'txid': parent.txid, 'vout': number} for parent in parents]
+    if not vin:
+        vin = [{'txid': 'ff' * 32, 'vout': number}]
+    return SimpleNamespace(txid='%064x' % number, fee=fee, weight=weight,
+                           vin=vin)
+
+
+def test_child_before_parent_is_linked_and_evicted_with_it():
+    mempool = Mempool(max_weight=1000)
+    parent = make_tx(1, 100, 400)
+    child = make_tx(2, 200, 400, [parent])
+
+    assert mempool.add_transaction(child)
+    assert mempool.add_transaction(parent)
+    assert mempool.children[parent.txid] == {child.txid}
+    assert mempool.parents[child.txid] == {parent.txid}
+    assert mempool.descendant_stats[parent.txid] == [300, 800]
+
+    # The parent's package has the lowest rate, so the child goes with it
+    assert mempool.add_transaction(make_tx(3, 10000, 400))
+    assert parent.txid not in mempool.transactions
+    assert child.txid not in mempool.transactions
+    assert mempool.total_weight == 400
+
+    # A spender of the evicted parent that arrives later can never be mined
+    assert not mempool.add_transaction(make_tx(4, 10000, 100, [parent]))
+
+
+def test_adopted_descendant_reachable_by_two_paths_is_counted_once():
+    mempool = Mempool()
+    grandparent = make_tx(1, 100, 400)
+    parent = make_tx(2, 100, 400, [grandparent])
+    # Spends both, so it reaches the grandparent directly and via parent
+    child = make_tx(3, 100, 400, [grandparent, parent])
+
+    assert mempool.add_transaction(grandparent)
+    assert mempool.add_transaction(child)
+    assert mempool.add_transaction(parent)
+    assert mempool.descendant_stats[grandparent.txid] == [300, 1200]
+    assert mempool.descendant_stats[parent.txid] == [200, 800]
+
+
+def test_package_limits():
+    mempool = Mempool(max_weight=10000, max_ancestors=3, max_descendants=3)
+    chain = [make_tx(1, 100, 400)]
+    for number in range(2, 5):
+        chain.append(make_tx(number, 100, 400, [chain[-1]]))
+
+    assert all(mempool.add_transaction(tx) for tx in chain[:3])
+    assert not mempool.add_transaction(chain[3])
+    assert chain[3].txid not in mempool.transactions
+
+    # The same limits apply when the parent arrives after its spenders
+    mempool = Mempool(max_weight=10000, max_ancestors=3, max_descendants=3)
+    assert all(mempool.add_transaction(tx) for tx in chain[1:])
+    assert not mempool.add_transaction(chain[0])
+
+    # An uncapped pool keeps whole chains, like the list without a cap
+    mempool = Mempool(max_ancestors=3, max_descendants=3)
+    assert all(mempool.add_transaction(tx) for tx in chain)
+
+
+def test_fee_floor_rises_on_eviction_and_decays():
+    now = [0.0]
+    mempool = Mempool(max_weight=800, clock=lambda: now[0])
+    assert mempool.add_transaction(make_tx(1, 400, 400))
+    assert mempool.add_transaction(make_tx(2, 800, 400))
+    assert not mempool.add_transaction(make_tx(3, 200, 400))
+
+    floor = 0.5 + INCREMENTAL_FEE_RATE
+    assert mempool.get_min_fee_rate() == floor
+    assert not mempool.meets_fee_floor(make_tx(4, 200, 400))
+    now[0] += FEE_FLOOR_HALFLIFE
+    assert mempool.get_min_fee_rate() == floor / 2
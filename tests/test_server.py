@@ -0,0 +1,179 @@
+import http.client
+import json
+import os
+import shutil
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from block import build_block_template, mine_header  # noqa: E402
+from cli import (DEFAULT_BITCOIN_ADDRESS, DEFAULT_BLOCK_HEIGHT,  # noqa: E402
+                 DEFAULT_PREVIOUS_BLOCK_HASH)
+from output import write_serialized_block  # noqa: E402
+from server import (create_template_server, make_rpc_server,  # noqa: E402
+                    rpc_call, RPCError, RPC_DESERIALIZATION_ERROR,
+                    RPC_INTERNAL_ERROR, RPC_INVALID_PARAMS,
+                    RPC_VERIFY_REJECTED)
+
+MEMPOOL_PATH = os.path.join(os.path.dirname(__file__), '..', 'mempool')
+# About one in 256 nonces meets this target, so mining takes moments
+EASY_TARGET = '00ff' + 'ff' * 30
+# Transactions in the fixture pool; the rest can be submitted
+POOL_SIZE = 20
+
+
+@pytest.fixture
+def rpc(tmp_path):
+    filenames = sorted(filename for filename in os.listdir(MEMPOOL_PATH)
+                       if filename.endswith('.json'))
+    pool_path = tmp_path / 'mempool'
+    pool_path.mkdir()
+    for filename in filenames[:POOL_SIZE]:
+        shutil.copy(os.path.join(MEMPOOL_PATH, filename), pool_path)
+
+    template_server = create_template_server(
+        str(pool_path), DEFAULT_BITCOIN_ADDRESS, DEFAULT_PREVIOUS_BLOCK_HASH,
+        EASY_TARGET, DEFAULT_BLOCK_HEIGHT, None)
+    server = make_rpc_server(template_server, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = "http://%s:%d/" % server.server_address
+    extra_paths = [os.path.join(MEMPOOL_PATH, filename)
+                   for filename in filenames[POOL_SIZE:]]
+    yield template_server, url, extra_paths
+    server.shutdown()
+    server.server_close()
+
+
+# Submit transactions until one is accepted; returns its txid and JSON text
+def submit_first_accepted(url, paths):
+    for path in paths:
+        with open(path) as file:
+            tx_json = file.read()
+        try:
+            return rpc_call(url, "submittransaction", [tx_json]), tx_json
+        except RPCError:
+            continue
+    raise AssertionError("No transaction was accepted")
+
+
+def mine_hex_block(template_server, tmp_path, merkle_root=None):
+    block = build_block_template(
+        list(template_server.mempool.transactions.values()),
+        template_server.bitcoin_address,
+        template_server.previous_block_hash,
+        template_server.difficulty_target,
+        template_server.block_height)
+    if merkle_root is not None:
+        block["merkle_root"] = merkle_root
+    mine_header(block)
+    path = tmp_path / 'block.hex'
+    write_serialized_block(block, path, hex_encoded=True)
+    return path.read_text()
+
+
+def test_getblocktemplate_is_cached_until_the_pool_changes(rpc):
+    template_server, url, extra_paths = rpc
+    template = rpc_call(url, "getblocktemplate")
+    cached = template_server._cached_template
+    assert rpc_call(url, "getblocktemplate") == template
+    assert template_server._cached_template is cached
+    assert len(template["transactions"]) == len(
+        template_server.mempool.transactions)
+
+    txid, tx_json = submit_first_accepted(url, extra_paths)
+    template = rpc_call(url, "getblocktemplate")
+    assert template_server._cached_template is not cached
+    assert txid in [tx["txid"] for tx in template["transactions"]]
+
+    # Resubmitting it is rejected and leaves the cached template alone
+    cached = template_server._cached_template
+    with pytest.raises(RPCError) as excinfo:
+        rpc_call(url, "submittransaction", [json.loads(tx_json)])
+    assert excinfo.value.code == RPC_VERIFY_REJECTED
+    assert excinfo.value.message == "txn-already-in-mempool"
+    assert rpc_call(url, "getblocktemplate") == template
+    assert template_server._cached_template is cached
+
+
+def test_submitblock_rejects_bad_merkle_root(rpc, tmp_path):
+    template_server, url, _ = rpc
+    pool_size = len(template_server.mempool.transactions)
+    block_hex = mine_hex_block(template_server, tmp_path, '11' * 32)
+
+    assert rpc_call(url, "submitblock", [block_hex]) == "bad-txnmrklroot"
+    assert len(template_server.mempool.transactions) == pool_size
+    assert template_server.block_height == DEFAULT_BLOCK_HEIGHT
+
+
+def test_submitblock_accepts_a_valid_block(rpc, tmp_path):
+    template_server, url, _ = rpc
+    block_hex = mine_hex_block(template_server, tmp_path)
+
+    assert rpc_call(url, "submitblock", [block_hex]) is None
+    assert template_server.mempool.transactions == {}
+    assert template_server.block_height == DEFAULT_BLOCK_HEIGHT + 1
+    assert rpc_call(url, "submitblock", [block_hex]) == "duplicate"
+
+
+def tampered_transaction(field, value):
+    with open(os.path.join(MEMPOOL_PATH, sorted(
+            os.listdir(MEMPOOL_PATH))[POOL_SIZE])) as file:
+        data = json.load(file)
+    if field == "value":
+        data["vout"][0]["value"] = value
+    elif field == "sequence":
+        data["vin"][0]["sequence"] = value
+    else:
+        data[field] = value
+    return data
+
+
+@pytest.mark.parametrize("method, params, code", [
+    ("submittransaction", [5], RPC_INVALID_PARAMS),
+    ("submittransaction", [[1]], RPC_INVALID_PARAMS),
+    ("submittransaction", {"a": 1}, RPC_INVALID_PARAMS),
+    ("submittransaction", ["[1]"], RPC_DESERIALIZATION_ERROR),
+    ("submittransaction", [tampered_transaction("value", -1)],
+     RPC_DESERIALIZATION_ERROR),
+    ("submittransaction", [tampered_transaction("locktime", -1)],
+     RPC_DESERIALIZATION_ERROR),
+    ("submittransaction", [tampered_transaction("version", 2 ** 32)],
+     RPC_DESERIALIZATION_ERROR),
+    ("submittransaction", [tampered_transaction("sequence", -1)],
+     RPC_DESERIALIZATION_ERROR),
+    ("submitblock", [5], RPC_INVALID_PARAMS),
+    ("submitblock", ["zz"], RPC_DESERIALIZATION_ERROR),
+])
+def test_malformed_params_get_rpc_errors(rpc, method, params, code):
+    _, url, _ = rpc
+    with pytest.raises(RPCError) as excinfo:
+        rpc_call(url, method, params)
+    assert excinfo.value.code == code
+
+
+def test_unexpected_errors_and_bad_headers_keep_the_server_up(
+        rpc, monkeypatch):
+    template_server, url, _ = rpc
+
+    def fail():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(template_server, "getblocktemplate", fail)
+    with pytest.raises(RPCError) as excinfo:
+        rpc_call(url, "getblocktemplate")
+    assert excinfo.value.code == RPC_INTERNAL_ERROR
+    monkeypatch.undo()
+
+    connection = http.client.HTTPConnection(
+        *url[len("http://"):-1].split(":"))
+    connection.putrequest("POST", "/")
+    connection.putheader("Content-Length", "abc")
+    connection.endheaders()
+    assert connection.getresponse().status == 400
+    connection.close()
+
+    assert rpc_call(url, "getblocktemplate")["height"] == DEFAULT_BLOCK_HEIGHT
@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cli import LAZY_MODULES, measure_startup  # noqa: E402
+
+
+# Generous compared to the `bench startup` budget, so a slow machine does
+# not fail the test; eager imports are what it guards against
+MAX_TEST_IMPORT_MS = 1000
+
+
+def test_cli_import_stays_lazy():
+    startup_ms, imported = measure_startup()
+    eager = [name for name in imported
+             if name in LAZY_MODULES or name.startswith('concurrent.')]
+    assert eager == []
+    assert startup_ms < MAX_TEST_IMPORT_MS